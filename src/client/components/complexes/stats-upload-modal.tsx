@@ -22,7 +22,7 @@ type StatsUploadBoxProps = {
   onSubmit? : (statsId: string, statsName: string) => void
 }
 
-const defaultMessage = `Please select a upload file (.csv) and input a stats "description".`
+const defaultMessage = `Please select a upload file (.csv, .csv.gz, .csv.bz2 or .zip) and input a stats "description".`
 
 const StatsUploadBox = React.memo<StatsUploadBoxProps>(({
   id        = "",
@@ -143,7 +143,7 @@ const StatsUploadBox = React.memo<StatsUploadBoxProps>(({
             key={ formKey }
             auxiliary="description"
             disabled={ !domain || !project || status.current.processing }
-            accept=".csv"
+            accept=".csv,.gz,.bz2,.zip"
             onSubmit={ handleSubmit }
             onCancel={ handleCancel }
           />
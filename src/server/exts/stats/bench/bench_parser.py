@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+################################################################################
+### Micro benchmark of the perfmon csv row parsers
+################################################################################
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from operator import itemgetter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib', 'stats'))
+import statslib
+
+### MM/DD/YYYY hh:mm:ss as DbConverter matches it
+RE_DATE = re.compile(r"^([0-9]{2})\/([0-9]{2})\/([0-9]{4}) ([0-9]{2}):([0-9]{2}):([0-9]{2})$")
+### columns of a table, below the default limit of sqlite
+TABLE_COLUMNS = 1000
+COMMIT_SIZE = 100
+
+################################################################################
+### Sample
+################################################################################
+def createSample(csvFile, rows, cols):
+    with open(csvFile, 'w') as fp:
+        title = [ '"(PDH-CSV 4.0) (Tokyo Standard Time)(-540)"' ]
+        title += [ '"\\\\bench\\Group(%d)\\Counter %d"' % (i % 10, i) for i in range(cols) ]
+        fp.write(','.join(title) + '\n')
+        for row in range(rows):
+            line = [ '"01/01/2020 %02d:%02d:%02d"' % (row // 3600 % 24, row // 60 % 60, row % 60) ]
+            line += [ '" "' if random.random() < 0.01 else '"%.6f"' % (random.random() * 1000) for i in range(cols) ]
+            fp.write(','.join(line) + '\n')
+    return
+
+################################################################################
+### Parsers
+################################################################################
+def convertDate(date):
+    match = RE_DATE.match(date)
+    if not match:
+        return None
+    return '%s-%s-%sT%s:%s:%sZ' % (match.groups()[2], match.groups()[0], match.groups()[1], match.groups()[3], match.groups()[4], match.groups()[5])
+
+### the former DbConverter: readline, peal quotes and split by commas, values are left as text for sqlite
+def parsePeal(csvFile, sink):
+    count = 0
+    with open(csvFile, 'r') as fp:
+        fp.readline()
+        while True:
+            line = fp.readline().replace('\n', '').replace('"', '').strip(',')
+            if not line:
+                break
+            data = line.split(',')
+            data[0] = convertDate(data[0])
+            if data[0] is None:
+                break
+            sink(data)
+            count += 1
+    return count
+
+def parseReader(csvFile, sink):
+    count = 0
+    reader = statslib.CsvReader(csvFile)
+    reader.readTitle()
+    while True:
+        data = reader.readRow()
+        if data is None:
+            break
+        data[0] = convertDate(data[0].strip())
+        if data[0] is None:
+            break
+        sink(data)
+        count += 1
+    reader.close()
+    return count
+
+### CsvReader parsing each line of a block by itself, as without numpy
+def parseLines(csvFile, sink):
+    module = statslib.numpy
+    statslib.numpy = None
+    try:
+        return parseReader(csvFile, sink)
+    finally:
+        statslib.numpy = module
+
+################################################################################
+### Sinks
+################################################################################
+def discard(data):
+    return
+
+### rows inserted into REAL columns of tables in memory as DbConverter does, sqlite converting text values itself
+class Inserter:
+    __db        = None
+    __plan      = None
+
+    def __init__(self, cols):
+        self.__db = sqlite3.connect(':memory:')
+        self.__plan = []
+        for start in range(0, cols, TABLE_COLUMNS):
+            table = 'T%d' % start
+            names = [ 'C%d' % i for i in range(start, min(start + TABLE_COLUMNS, cols)) ]
+            self.__db.execute('CREATE TABLE %s (date TEXT, %s)' % (table, ','.join(map(lambda x: '%s REAL' % x, names))))
+            statement = 'INSERT INTO %s VALUES (%s)' % (table, ','.join([ '?' ] * (len(names) + 1)))
+            getter = itemgetter(0, *range(start + 1, start + len(names) + 1))
+            self.__plan.append((statement, getter, []))
+        pass
+
+    def __call__(self, data):
+        for (statement, getter, buffer) in self.__plan:
+            buffer.append(getter(data))
+        if len(buffer) >= COMMIT_SIZE:
+            self.flush()
+        return
+
+    def flush(self):
+        for (statement, getter, buffer) in self.__plan:
+            self.__db.executemany(statement, buffer)
+            del buffer[:]
+        self.__db.commit()
+        return
+
+    def close(self):
+        self.__db.close()
+        return
+
+def measure(name, parser, csvFile, cols, insert=False):
+    sink = Inserter(cols) if insert else discard
+    start = time.time()
+    count = parser(csvFile, sink)
+    if insert:
+        sink.flush()
+    elapsed = time.time() - start
+    if insert:
+        sink.close()
+    print('%-8s %8d rows %8.3f sec %10.1f rows/sec' % (name, count, elapsed, count / elapsed))
+    return
+
+################################################################################
+### Main
+################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro benchmark of the perfmon csv row parsers.')
+    parser.add_argument('-r', '--rows', type=int, default=5000, help='Number of rows.')
+    parser.add_argument('-c', '--cols', type=int, default=500, help='Number of counters.')
+    parser.add_argument('-i', '--insert', action='store_true', help='Insert the rows into sqlite as well.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dirPath:
+        csvFile = os.path.join(dirPath, 'bench.csv')
+        createSample(csvFile, args.rows, args.cols)
+        measure('peal', parsePeal, csvFile, args.cols, insert=args.insert)
+        measure('lines', parseLines, csvFile, args.cols, insert=args.insert)
+        if statslib.numpy is not None:
+            measure('numpy', parseReader, csvFile, args.cols, insert=args.insert)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+################################################################################
+### Benchmark of statslib on synthetic perfmon csvs
+################################################################################
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib', 'stats'))
+import statslib
+
+################################################################################
+### Constants
+################################################################################
+### (rows, columns) of each size tier
+TIERS = {
+    'small'     : (500, 200),
+    'medium'    : (2000, 1000),
+    'large'     : (8640, 3000)
+}
+### (group, prefix of instances or None for a single one, counters) as esxtop writes them
+GROUPS = [
+    ('Memory', None, [ 'Free MBytes', 'Kernel MBytes', 'NonKernel MBytes', 'Swap MBytes Read/sec', 'Swap MBytes Write/sec', 'PShare Common MBytes' ]),
+    ('Physical Cpu', '', [ '% Processor Time', '% Util Time', '% Core Util Time' ]),
+    ('Vcpu', 'vm', [ '% Used', '% Run', '% Ready', '% Wait', '% Co-Stop' ]),
+    ('Network Port', 'port', [ 'Packets Transmitted/sec', 'Packets Received/sec', 'MBits Transmitted/sec', 'MBits Received/sec' ]),
+    ('Physical Disk Adapter', 'vmhba', [ 'Reads/sec', 'Writes/sec', 'MBytes Read/sec', 'MBytes Written/sec', 'Average Driver MilliSec/Command' ])
+]
+PATTERNS    = [ 'idle', 'noise', 'wave', 'step', 'spiky' ]
+INTERVAL    = 20
+MISSING     = 0.002
+DATA_COUNTERS = 10
+THRESHOLD   = 0.2
+
+################################################################################
+### Sample
+################################################################################
+### [(group, instance, counter), ...] of about cols columns, instances are added round-robin
+def createColumns(cols):
+    columns = []
+    for (group, prefix, counters) in GROUPS:
+        if prefix is None:
+            columns.extend([ (group, None, counter) for counter in counters ])
+    instance = 0
+    while len(columns) < cols:
+        for (group, prefix, counters) in GROUPS:
+            if prefix is None:
+                continue
+            name = '%d' % instance if prefix == '' else '%d:%s%04d' % (1000 + instance, prefix, instance)
+            columns.extend([ (group, name, counter) for counter in counters ])
+        instance += 1
+    return columns[:max(cols, 1)]
+
+### a function of the row for each column, of the patterns seen in real captures
+def createSeries(rng, rows):
+    pattern = rng.choice(PATTERNS)
+    level = rng.choice([ 1, 10, 100, 1000, 100000 ]) * rng.random()
+    if pattern == 'idle':
+        return lambda x: 0.0
+    if pattern == 'noise':
+        return lambda x: max(level + rng.gauss(0, level * 0.1), 0.0)
+    if pattern == 'wave':
+        period = rng.randint(60, 4320)
+        return lambda x: level * (1.5 + math.sin(2 * math.pi * x / period)) + rng.random()
+    if pattern == 'step':
+        shifts = sorted(rng.sample(range(rows), min(rng.randint(1, 4), rows)))
+        return lambda x: level * (1 + sum(map(lambda y: x >= y, shifts))) + rng.gauss(0, level * 0.02)
+    return lambda x: level * (20 if rng.random() < 0.01 else 1) * rng.random()
+
+### quoted PDH csv of rows samples every INTERVAL seconds, the same for the same arguments
+def createSample(csvFile, rows, cols, host='benchhost', seed=0):
+    rng = random.Random(seed)
+    columns = createColumns(cols)
+    series = list(map(lambda x: createSeries(rng, rows), columns))
+    date = datetime.datetime(2020, 1, 1)
+    with open(csvFile, 'w') as fp:
+        title = [ '"(PDH-CSV 4.0) (UTC)(0)"' ]
+        title += list(map(lambda x: '"\\\\%s\\%s\\%s"' % (host, x[0] if x[1] is None else '%s(%s)' % (x[0], x[1]), x[2]), columns))
+        fp.write(','.join(title) + '\n')
+        for row in range(rows):
+            line = [ '"%s"' % (date + datetime.timedelta(seconds=row * INTERVAL)).strftime('%m/%d/%Y %H:%M:%S') ]
+            line += list(map(lambda x: '" "' if rng.random() < MISSING else '"%.2f"' % x(row), series))
+            fp.write(','.join(line) + '\n')
+    return
+
+### generated once into workDir and reused by later runs
+def prepareSample(workDir, rows, cols):
+    csvFile = os.path.join(workDir, 'sample-%d-%d.csv' % (rows, cols))
+    if not os.path.exists(csvFile):
+        start = time.time()
+        createSample(csvFile + '.tmp', rows, cols)
+        os.rename(csvFile + '.tmp', csvFile)
+        print('generated %s in %.1f sec' % (os.path.basename(csvFile), time.time() - start))
+    return csvFile
+
+################################################################################
+### Operations
+################################################################################
+### a link to the csv in an empty directory, as the converter writes next to it
+def convert(csvFile, backend):
+    dirPath = tempfile.mkdtemp(prefix='bench-')
+    try:
+        target = os.path.join(dirPath, os.path.basename(csvFile))
+        os.symlink(csvFile, target)
+        statslib.metrics.reset()
+        basename = statslib.convertCsv2Database(target, preserve=True, mode='fast', backend=backend)
+        return { 'basename': basename, 'phases': statslib.metrics.report()['phases'] }
+    finally:
+        shutil.rmtree(dirPath, ignore_errors=True)
+
+### "main->sub->counter+counter,..." of the first DATA_COUNTERS counters of the db
+def selectCounters(dbFile):
+    result = []
+    for (main, subs) in statslib.getStatsCounters(dbFile).items():
+        for (sub, counters) in subs.items():
+            picked = counters[:DATA_COUNTERS - sum(map(lambda x: x.count('+') + 1, result))]
+            if len(picked) > 0:
+                result.append('%s->%s->%s' % (main, sub, '+'.join(picked)))
+    return ','.join(result)
+
+### name, function of (csvFile, dbFile, counters), unit and the amount of the unit per call
+def createOperations(rows, cols, bytes):
+    operations = [
+        ('extractStatsName', lambda c, d, k: statslib.extractStatsName(c), 'MB/sec', bytes / 1000000.0),
+        ('convertCsv2Database', lambda c, d, k: convert(c, 'sqlite'), 'rows/sec', rows),
+        ('convertCsv2Database-column', lambda c, d, k: convert(c, 'column'), 'rows/sec', rows),
+        ('getStatsCounters-all', lambda c, d, k: statslib.getStatsCounters(d), 'counters/sec', cols),
+        ('getStatsCounters-nonzero', lambda c, d, k: statslib.getStatsCounters(d, option='nonzero'), 'counters/sec', cols)
+    ]
+    for score in statslib.SCORES:
+        operations.append(('getStatsCounters-vitality-%s' % score, lambda c, d, k, score=score: statslib.getStatsCounters(d, option='vitality', score=score), 'counters/sec', cols))
+    operations += [
+        ('searchStatsCounters', lambda c, d, k: statslib.searchStatsCounters(d, 'cpu ready'), 'counters/sec', cols),
+        ('getStatsData', lambda c, d, k: statslib.getStatsData(d, k), 'values/sec', rows * DATA_COUNTERS),
+        ('getStatsData-points', lambda c, d, k: statslib.getStatsData(d, k, maxPoints=500), 'values/sec', rows * DATA_COUNTERS),
+        ('getStatsData-interval', lambda c, d, k: statslib.getStatsData(d, k, interval=300), 'values/sec', rows * DATA_COUNTERS)
+    ]
+    return operations
+
+################################################################################
+### Measurement
+################################################################################
+def runChild(queue, function, args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, statslib.peakMemory(), result.get('phases') if isinstance(result, dict) else None))
+
+### seconds in a forked process, so that the peak rss is of the operation and not of the earlier ones
+def measure(function, args):
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=runChild, args=(queue, function, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def runTier(name, csvFile, rows, cols, repeat):
+    dirPath = tempfile.mkdtemp(prefix='bench-')
+    try:
+        # the database read by the get operations, converted once here
+        target = os.path.join(dirPath, os.path.basename(csvFile))
+        os.symlink(csvFile, target)
+        dbFile = os.path.join(dirPath, statslib.convertCsv2Database(target, preserve=True, mode='fast') + '.db')
+        counters = selectCounters(dbFile)
+        bytes = os.path.getsize(csvFile)
+        results = {}
+        for (operation, function, unit, amount) in createOperations(rows, cols, bytes):
+            samples = list(map(lambda x: measure(function, (csvFile, dbFile, counters)), range(repeat)))
+            seconds = min(map(lambda x: x[0], samples))
+            results[operation] = {
+                'seconds'   : round(seconds, 6),
+                'throughput': round(amount / seconds, 1) if seconds > 0 else None,
+                'unit'      : unit,
+                'peak_rss'  : max(map(lambda x: x[1] or 0, samples)),
+            }
+            if samples[0][2] is not None:
+                results[operation]['phases'] = samples[0][2]
+            print('%-8s %-34s %10.4f sec %14.1f %-13s %8s KiB' % (name, operation, seconds, results[operation]['throughput'] or 0, unit, results[operation]['peak_rss']))
+    finally:
+        shutil.rmtree(dirPath, ignore_errors=True)
+    return { 'rows': rows, 'columns': cols, 'bytes': bytes, 'results': results }
+
+################################################################################
+### Baseline
+################################################################################
+### operations slower or larger than the baseline by more than threshold
+def compareBaseline(report, baseline, threshold):
+    regressions = []
+    for (tier, current) in report['tiers'].items():
+        previous = baseline.get('tiers', {}).get(tier)
+        if previous is None or (previous['rows'], previous['columns']) != (current['rows'], current['columns']):
+            continue
+        for (operation, result) in current['results'].items():
+            base = previous['results'].get(operation)
+            if base is None:
+                continue
+            for key in [ 'seconds', 'peak_rss' ]:
+                if not base.get(key) or not result.get(key):
+                    continue
+                ratio = result[key] / base[key]
+                mark = 'REGRESSION' if ratio > 1 + threshold else 'improved' if ratio < 1 - threshold else ''
+                print('%-8s %-34s %-9s %12s -> %-12s x%.2f %s' % (tier, operation, key, base[key], result[key], ratio, mark))
+                if ratio > 1 + threshold:
+                    regressions.append({ 'tier': tier, 'operation': operation, 'key': key, 'baseline': base[key], 'current': result[key], 'ratio': round(ratio, 3) })
+    return regressions
+
+################################################################################
+### Main
+################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of statslib on synthetic perfmon csvs.')
+    parser.add_argument('-t', '--tiers', default='small,medium', help='Comma separated size tiers of %s.' % ', '.join(map(lambda x: '%s=%dx%d' % (x[0], x[1][0], x[1][1]), TIERS.items())))
+    parser.add_argument('-r', '--rows', type=int, help='Number of rows of a custom tier, instead of --tiers.')
+    parser.add_argument('-c', '--cols', type=int, default=500, help='Number of counters of a custom tier.')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='Number of runs of each operation, of which the fastest is taken.')
+    parser.add_argument('-w', '--workdir', default=os.path.join(tempfile.gettempdir(), 'statslib-bench'), help='Directory of the generated csvs, which are reused.')
+    parser.add_argument('-o', '--output', help='Write the results as json, e.g. to be a baseline.')
+    parser.add_argument('-b', '--baseline', help='Compare the results with a json written by --output.')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='Ratio of slowdown or growth to flag as a regression.')
+    args = parser.parse_args()
+
+    tiers = { 'custom': (args.rows, args.cols) } if args.rows else dict(map(lambda x: (x, TIERS[x]), args.tiers.split(',')))
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        'date'      : datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'version'   : statslib.__version__,
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'numpy'     : statslib.numpy is not None,
+        'tiers'     : {}
+    }
+    for (name, (rows, cols)) in tiers.items():
+        csvFile = prepareSample(args.workdir, rows, cols)
+        report['tiers'][name] = runTier(name, csvFile, rows, cols, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as fp:
+            baseline = json.load(fp)
+        regressions = compareBaseline(report, baseline, args.threshold)
+        if len(regressions) > 0:
+            print('%d regressions over %d%%' % (len(regressions), args.threshold * 100))
+            sys.exit(1)
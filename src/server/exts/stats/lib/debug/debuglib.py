@@ -5,7 +5,7 @@
 
 from __future__ import print_function
 
-__all__     = ['SetupLogger']
+__all__     = ['SetupLogger', 'SetupProfiler', 'SaveProfile']
 __author__  = 'aumezawa'
 __version__ = '1.0.0'
 
@@ -13,10 +13,13 @@ __version__ = '1.0.0'
 ################################################################################
 ### Required Modules
 ################################################################################
+import cProfile
 import logging
 import logging.config
 import os
+import pstats
 import sys
+import time
 
 
 ################################################################################
@@ -26,6 +29,12 @@ RET_NORMAL_END  =  0
 RET_SYS_ERROR   = -1
 
 
+################################################################################
+### Constants
+################################################################################
+PROFILE_LINES = 50
+
+
 ################################################################################
 ### External Functions
 ################################################################################
@@ -71,5 +80,26 @@ def SetupLogger(filename='debug.log', dirpath='.', mode=logging.DEBUG):
             }
         })
     except Exception as e:
-        print(e)
+        # stdout carries the replies of main.py, and there is no log yet
+        print(e, file=sys.stderr)
         sys.exit(RET_SYS_ERROR)
+
+
+def SetupProfiler():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+### <filename>-<pid>-<time>.pstats for pstats or snakeviz, and .txt of the top functions by cumulative time
+def SaveProfile(profiler, filename='profile', dirpath='.'):
+    profiler.disable()
+    path = os.path.join(dirpath, '%s-%d-%s' % (filename, os.getpid(), time.strftime('%Y%m%dT%H%M%S')))
+    try:
+        profiler.dump_stats(path + '.pstats')
+        with open(path + '.txt', 'w') as fp:
+            pstats.Stats(profiler, stream=fp).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    except Exception as e:
+        logging.getLogger('file').error(e)
+        return None
+    return path + '.pstats'
@@ -6,7 +6,7 @@
 from __future__ import print_function
 from unittest import result
 
-__all__     = ['extractStatsName', 'convertCsv2Database', 'getStatsCounters', 'getStatsData']
+__all__     = ['extractStatsName', 'probeStats', 'convertCsv2Database', 'getStatsCounters', 'searchStatsCounters', 'getStatsData', 'iterStatsData', 'columnarizeData', 'encodeColumns', 'DatabasePool', 'ResultCache', 'metrics']
 __author__  = 'aumezawa'
 __version__ = '0.2.0'
 
@@ -14,13 +14,39 @@ __version__ = '0.2.0'
 ################################################################################
 ### Required Modules
 ################################################################################
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime as dt
+from operator import itemgetter
+import bz2
+import calendar
+import csv
+import gzip
+import hashlib
+import heapq
+import io
 import json
 import logging
+import mmap
+import multiprocessing
 import os
 import re
+import shutil
 import sqlite3
+import struct
 import sys
+import time
+import warnings
+import zipfile
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 ################################################################################
@@ -43,8 +69,51 @@ except Exception as e:
 ################################################################################
 ### Internal Parameters
 ################################################################################
-DB_VERSION  = 1
+DB_VERSION  = 2
 COMMIT_SIZE = 1000
+LOCK_TIMEOUT= 5
+MIGRATE_TIMEOUT = 600
+CHUNK_SIZE  = 1000
+POOL_SIZE   = 16
+SEARCH_LIMIT= 50
+VITALITY_TOP= 30
+CHANGE_WINDOW = 10
+CACHE_SIZE  = 64 * 1024 * 1024
+CACHE_DISK  = 256 * 1024 * 1024
+ROLLUPS     = [60, 600, 3600]
+ROLLUP_BLOCK= 400
+BACKENDS    = ['sqlite', 'column']
+COLUMN_BLOCK= 256
+TAIL_SIZE   = 1024 * 1024
+READ_BUFFER = 1024 * 1024
+# csv bytes per worker of the parallel conversion, as each worker parses the whole csv for its columns
+SHARD_SIZE  = 64 * 1024 * 1024
+COMPRESSIONS= [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'PK\x03\x04', 'zip')
+]
+PERCENTILES = [95, 99]
+FILLS       = ['null', 'forward']
+STATISTICS  = ['count', 'average', 'variance', 'min', 'max'] + list(map(lambda x: 'p%d' % x, PERCENTILES)) + ['changes']
+SCORES      = ['variance', 'cv', 'peak', 'changes']
+CATALOG_KEYS= {'name': 'counter', 'index': 'idx'}
+LOAD_MODES  = {
+    # durable, the default of sqlite
+    'safe': [
+        ('journal_mode', 'DELETE'),
+        ('synchronous', 'FULL'),
+        ('cache_size', -2000)
+    ],
+    # no rollback journal and no fsync, a broken database is re-converted from the csv, which is to be preserved (-p)
+    'fast': [
+        ('page_size', 4096),
+        ('journal_mode', 'OFF'),
+        ('synchronous', 'OFF'),
+        ('cache_size', -262144),
+        ('temp_store', 'MEMORY')
+    ]
+}
 
 
 ################################################################################
@@ -52,16 +121,21 @@ COMMIT_SIZE = 1000
 ################################################################################
 def extractStatsName(csvFile):
     converter = DbConverter(csvFile)
-    meta = converter.createMeta()
-    if meta is None:
+    probe = converter.probeMeta()
+    if probe is None:
         return 'Unknown'
     #
-    return meta.getResourceName()
+    return probe['basename']
+
+
+def probeStats(csvFile):
+    converter = DbConverter(csvFile)
+    return converter.probeMeta()
 
 
-def convertCsv2Database(csvFile, preserve=False):
+def convertCsv2Database(csvFile, preserve=False, mode='safe', backend='sqlite', jobs=1, append=False):
     converter = DbConverter(csvFile, preserve=preserve)
-    db = converter.createDatabase()
+    db = converter.appendDatabase(mode=mode, backend=backend, jobs=jobs) if append else converter.createDatabase(mode=mode, backend=backend, jobs=jobs)
     if db is None:
         return None
     #
@@ -71,26 +145,120 @@ def convertCsv2Database(csvFile, preserve=False):
     return resouceName
 
 
-def getStatsCounters(dbFile, option=None):
-    db = Database(dbFile)
-    if option == 'nonzero':
-        return db.getColumnNonzeroCounters()
-    elif option == 'vitality':
-        return db.getColumnVitalityCounters(top=30)
-    else:
-        return db.getColumnAllCounters()
+### top, score and groupTop (at most per main group) are of the 'vitality' option
+def getStatsCounters(dbFile, option=None, pool=None, top=VITALITY_TOP, score='variance', groupTop=None):
+    with metrics.phase('open'):
+        db = pool.get(dbFile) if pool is not None else Database(dbFile)
+    if db is None:
+        return None
+    with metrics.phase('catalog'):
+        if option == 'nonzero':
+            return db.getColumnNonzeroCounters()
+        elif option == 'vitality':
+            return db.getColumnVitalityCounters(top=top, score=score, groupTop=groupTop)
+        else:
+            return db.getColumnAllCounters()
 
 
-def getStatsData(dbFile, counters, first=None, last=None):
-    db = Database(dbFile)
-    return db.selectMultiData(counters)
+### counters of which main, sub or name contains every word of query, in the order of the csv,
+### paged by offset and limit as {'total': <N>, 'counters': [[main, sub, counter], ...]}
+def searchStatsCounters(dbFile, query, offset=0, limit=SEARCH_LIMIT, pool=None):
+    with metrics.phase('open'):
+        db = pool.get(dbFile) if pool is not None else Database(dbFile)
+    if db is None:
+        return None
+    with metrics.phase('catalog'):
+        return db.searchCounters(query, offset=offset, limit=limit)
+
+
+### dbFile may be a list of databases, e.g. of several hosts, whose keys are prefixed by
+### "<basename>/" ("<basename>#<N>/" for the same one again) and whose rows are aligned
+### on the date, resampled to interval seconds if given
+def getStatsData(dbFile, counters, first=None, last=None, maxPoints=None, pool=None, interval=None, fill='null', cache=None):
+    dbFiles = dbFile if isinstance(dbFile, (list, tuple)) else [ dbFile ]
+    first = normalizeDate(first)
+    last = normalizeDate(last)
+    query = [ counters, first, last, maxPoints, interval, fill ]
+    if cache is not None:
+        with metrics.phase('cache'):
+            data = cache.get(dbFiles, query)
+        if data is not None:
+            metrics.count('cache_hits')
+            metrics.count('rows', len(data))
+            return data
+    series = []
+    keys = []
+    prefixes = []
+    for path in dbFiles:
+        with metrics.phase('open'):
+            db = pool.get(path) if pool is not None else Database(path)
+        if db is None:
+            return None
+        rollup = db.getRollupInterval(first, last, maxPoints) if maxPoints and not interval else None
+        with metrics.phase('query'):
+            data = db.selectMultiData(counters, first=first, last=last, interval=rollup, fill=fill)
+        if data is None:
+            return None
+        if interval:
+            with metrics.phase('resample'):
+                data = resampleData(data, interval)
+        if len(dbFiles) > 1:
+            prefix = db.getResourceName()
+            if prefix in prefixes:
+                prefix = '%s#%d' % (prefix, len(prefixes))
+            prefixes.append(prefix)
+            data = prefixDictList(data, prefix + '/')
+            keys.append(list(map(lambda x: prefix + '/' + x, db.getMultiDataKeys(counters))))
+        series.append(data)
+    if len(series) == 0:
+        return None
+    with metrics.phase('merge'):
+        data = series[0] if len(series) == 1 else mergeDictList(series, fill=fill, keys=keys)
+    if maxPoints:
+        with metrics.phase('downsample'):
+            data = downsampleData(data, maxPoints)
+    if cache is not None:
+        with metrics.phase('cache'):
+            cache.put(dbFiles, query, data)
+    metrics.count('rows', len(data))
+    return data
+
+
+### chunks of CHUNK_SIZE rows of getStatsData, read by fetchmany from a single database unless
+### the whole data is needed first, i.e. for several databases, resampling or downsampling
+def iterStatsData(dbFile, counters, first=None, last=None, maxPoints=None, pool=None, interval=None, fill='null', size=CHUNK_SIZE):
+    if isinstance(dbFile, (list, tuple)) or interval or maxPoints:
+        data = getStatsData(dbFile, counters, first=first, last=last, maxPoints=maxPoints, pool=pool, interval=interval, fill=fill)
+        if data is None:
+            return
+        for offset in range(0, len(data), size):
+            yield data[offset:offset + size]
+        return
+    #
+    db = pool.get(dbFile) if pool is not None else Database(dbFile)
+    if db is None:
+        return
+    chunk = []
+    for row in db.iterMultiData(counters, first=normalizeDate(first), last=normalizeDate(last), fill=fill):
+        chunk.append(row)
+        if len(chunk) >= size:
+            metrics.count('rows', len(chunk))
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        metrics.count('rows', len(chunk))
+        yield chunk
 
 
 ################################################################################
 ### Class - Meta
 ################################################################################
+### the meta is saved as json in the .inf and as a catalog of "@meta" and "@columns" tables in
+### the .db, which is read lazily: columns are looked up by sql until the whole dict is needed
 class DbMeta:
     __resource  = None
+    __catalog   = None
+    __shared    = False
     __valid     = False
     __name      = None
     __version   = DB_VERSION
@@ -98,27 +266,34 @@ class DbMeta:
     __first     = None
     __last      = None
     __columns   = None
+    __rollups   = None
+    __backend   = None
     __update    = False
+    __touched   = None
 
-    def __init__(self, infFile):
+    ### db is a connection of the .db to share, e.g. of the Database reading the data
+    def __init__(self, infFile, db=None):
         self.__resource = infFile
-        self.__load()
+        self.__load(db)
         pass
 
     def __del__(self):
         if self.__update:
             self.__save()
+        self.__close()
         pass
 
     @classmethod
-    def create(cls, dirPath, name, date, first, last, columns):
+    def create(cls, dirPath, name, date, first, last, columns, backend='sqlite'):
         infFile = os.path.join(dirPath, '%s_%s_%s.inf' % (name, date, DB_VERSION))
         object = cls(infFile)
-        object.__setParams(name, date, first, last, columns)
+        object.__setParams(name, date, first, last, columns, backend)
         object.__save()
         return object
 
-    def __setParams(self, name, date, first, last, columns):
+    def __setParams(self, name, date, first, last, columns, backend):
+        self.__close()
+        self.__backend = backend
         self.__name = name
         self.__date = date
         self.__first = first
@@ -127,15 +302,25 @@ class DbMeta:
         self.__valid = True
         return
 
+    def __close(self):
+        if self.__catalog is not None and not self.__shared:
+            try:
+                self.__catalog.close()
+            except Exception as e:
+                logger.error(e)
+        self.__catalog = None
+        return
+
     def getWorkingDirectory(self):
         if not self.__valid:
             return None
         return os.path.dirname(self.__resource)
 
+    ### the name of the files, which keeps the version of the conversion when migrated
     def getResourceName(self):
         if not self.__valid:
             return None
-        return '%s_%s_%s' % (self.__name, self.__date, self.__version)
+        return os.path.splitext(os.path.basename(self.__resource))[0]
 
     def getName(self):
         if not self.__valid:
@@ -165,25 +350,78 @@ class DbMeta:
     def getColumns(self):
         if not self.__valid:
             return None
+        if not self.__loadColumns():
+            return None
         return self.__columns
 
     def updateColumn(self, main, sub, counter, key, value):
         if not self.__valid:
             return False
+        if not self.__loadColumns():
+            return False
         try:
             self.__columns[main][sub][counter][key] = value
             self.__update = True
+            if self.__touched is not None:
+                self.__touched.add((main, sub, counter))
         except Exception as e:
             logger.error(e)
             return False
         return True
 
-    def getColumnMainGroups(self):
+    def updateLast(self, last):
+        if not self.__valid:
+            return False
+        self.__last = last
+        self.__update = True
+        return True
+
+    def updateVersion(self, version):
+        if not self.__valid:
+            return False
+        self.__version = version
+        self.__update = True
+        return True
+
+    def getRollups(self):
         if not self.__valid:
             return []
-        if self.__columns is None:
+        return self.__rollups or []
+
+    def getBackend(self):
+        if not self.__valid:
+            return None
+        return self.__backend or 'sqlite'
+
+    def updateRollups(self, rollups):
+        if not self.__valid:
+            return False
+        self.__rollups = rollups
+        self.__update = True
+        return True
+
+    ### the catalog is used while the columns are not loaded
+    def __lazy(self):
+        return self.__columns is None and self.__catalog is not None
+
+    def __select(self, sql, params=()):
+        return self.__catalog.execute(sql, params).fetchall()
+
+    ### {main: {sub: [counter, ...]}} in the order of the csv
+    def __nestRows(self, rows):
+        result = {}
+        for (main, sub, counter) in rows:
+            result.setdefault(main, {}).setdefault(sub, []).append(counter)
+        return result
+
+    def getColumnMainGroups(self):
+        if not self.__valid:
             return []
         try:
+            if self.__lazy():
+                return list(map(itemgetter(0), self.__select('SELECT main FROM "@columns" GROUP BY main ORDER BY min(idx)')))
+            if self.__columns is None:
+                return []
             result = list(self.__columns.keys())
         except Exception as e:
             logger.error(e)
@@ -193,11 +431,13 @@ class DbMeta:
     def getColumnSubGroups(self, main):
         if not self.__valid:
             return []
-        if self.__columns is None:
-            return []
-        if main not in self.getColumnMainGroups():
-            return []
         try:
+            if self.__lazy():
+                return list(map(itemgetter(0), self.__select('SELECT sub FROM "@columns" WHERE main = ? GROUP BY sub ORDER BY min(idx)', (main,))))
+            if self.__columns is None:
+                return []
+            if main not in self.getColumnMainGroups():
+                return []
             result = list(self.__columns[main].keys())
         except Exception as e:
             logger.error(e)
@@ -207,11 +447,16 @@ class DbMeta:
     def getColumnCounters(self, main, sub, key=None):
         if not self.__valid:
             return []
-        if self.__columns is None:
-            return []
-        if main not in self.getColumnMainGroups() or sub not in self.getColumnSubGroups(main):
-            return []
         try:
+            if self.__lazy():
+                column = CATALOG_KEYS.get(key, key) if key is not None else 'counter'
+                if column not in [ 'counter', 'idx' ] + STATISTICS:
+                    raise KeyError(key)
+                return list(map(itemgetter(0), self.__select('SELECT "%s" FROM "@columns" WHERE main = ? AND sub = ? ORDER BY idx' % (column), (main, sub))))
+            if self.__columns is None:
+                return []
+            if main not in self.getColumnMainGroups() or sub not in self.getColumnSubGroups(main):
+                return []
             if key is None:
                 result = list(self.__columns[main][sub].keys())
             else:
@@ -224,9 +469,11 @@ class DbMeta:
     def getColumnAllCounters(self):
         if not self.__valid:
             return {}
-        if self.__columns is None:
-            return {}
         try:
+            if self.__lazy():
+                return self.__nestRows(self.__select('SELECT main, sub, counter FROM "@columns" ORDER BY idx'))
+            if self.__columns is None:
+                return {}
             result = {
                 main: {
                     sub: list(counters.keys()) for (sub, counters) in subs.items()
@@ -240,9 +487,11 @@ class DbMeta:
     def getColumnNonzeroCounters(self):
         if not self.__valid:
             return {}
-        if self.__columns is None:
-            return {}
         try:
+            if self.__lazy():
+                return self.__nestRows(self.__select('SELECT main, sub, counter FROM "@columns" WHERE average >= 1 ORDER BY idx'))
+            if self.__columns is None:
+                return {}
             result = {
                 main: {
                     sub: list(map(lambda x: x['name'], filter(lambda x: x['average'] >= 1, counters.values()))) for (sub, counters) in subs.items()
@@ -254,29 +503,90 @@ class DbMeta:
             return {}
         return result
 
-    def getColumnVitalityCounters(self, top=10):
+    ### the top counters by score of SCORES, at most groupTop of each main group if given, which
+    ### are ranked in the catalog at conversion and by heaps of the columns otherwise
+    def getColumnVitalityCounters(self, top=VITALITY_TOP, score='variance', groupTop=None):
         if not self.__valid:
             return {}
-        if self.__columns is None:
+        if score not in SCORES:
+            logger.error('Unknown score of vitality. - %s' % score)
             return {}
         try:
-            vals = []
-            for main in self.__columns:
-                for sub in self.__columns[main]:
-                    for counter in self.__columns[main][sub]:
-                        vals.append(self.__columns[main][sub][counter]['variance'])
-            vals.sort(reverse=True)
-            result = {
-                main: {
-                    sub: list(map(lambda x: x['name'], filter(lambda x: x['variance'] >= vals[top-1], counters.values()))) for (sub, counters) in subs.items()
-                } for (main, subs) in self.__columns.items()
-            }
-            cleanupNestedDict(result, level=2)
+            if self.__lazy():
+                try:
+                    if groupTop:
+                        rows = self.__select('SELECT idx, main, sub, counter FROM (SELECT value, idx, main, sub, counter, row_number() OVER (PARTITION BY main ORDER BY value DESC, idx) AS n FROM "@rankings" WHERE score = ?) WHERE n <= ? ORDER BY value DESC, idx LIMIT ?', (score, groupTop, top))
+                    else:
+                        rows = self.__select('SELECT idx, main, sub, counter FROM "@rankings" WHERE score = ? ORDER BY value DESC, idx LIMIT ?', (score, top))
+                    return self.__nestRows(list(map(lambda x: x[1:], sorted(rows))))
+                except sqlite3.OperationalError:
+                    # catalogs of older converters have no rankings
+                    if not self.__loadColumns():
+                        return {}
+            if self.__columns is None:
+                return {}
+            candidates = []
+            for (main, subs) in self.__columns.items():
+                group = ((scoreOfColumn(column, score), -column['index'], main, sub, counter) for (sub, counters) in subs.items() for (counter, column) in counters.items())
+                candidates.extend(heapq.nlargest(groupTop, group) if groupTop else group)
+            ranked = heapq.nlargest(max(top, 0), candidates)
+            result = self.__nestRows(list(map(lambda x: x[2:], sorted(ranked, key=lambda x: -x[1]))))
         except Exception as e:
             logger.error(e)
             return {}
         return result
 
+    ### words are matched case-insensitively, by the trigram index of "@search" for 3 characters or
+    ### more, and by a scan of the catalog or the columns otherwise
+    def searchCounters(self, query, offset=0, limit=SEARCH_LIMIT):
+        if not self.__valid:
+            return None
+        words = (query or '').split()
+        try:
+            if self.__lazy():
+                try:
+                    (where, params) = self.__searchClause(words, index=True)
+                    (total,) = self.__select('SELECT count(*) FROM "@columns"%s' % (where), params)[0]
+                except sqlite3.OperationalError:
+                    (where, params) = self.__searchClause(words, index=False)
+                    (total,) = self.__select('SELECT count(*) FROM "@columns"%s' % (where), params)[0]
+                rows = self.__select('SELECT main, sub, counter FROM "@columns"%s ORDER BY idx LIMIT ? OFFSET ?' % (where), params + [ limit, offset ])
+                return {'total': total, 'counters': list(map(list, rows))}
+            if self.__columns is None:
+                return None
+            words = list(map(lambda x: x.lower(), words))
+            rows = []
+            for (main, subs) in self.__columns.items():
+                for (sub, counters) in subs.items():
+                    for (counter, column) in counters.items():
+                        names = [ main.lower(), sub.lower(), counter.lower() ]
+                        if all(map(lambda x: any(map(lambda y: x in y, names)), words)):
+                            rows.append([ column['index'], main, sub, counter ])
+            rows.sort(key=itemgetter(0))
+        except Exception as e:
+            logger.error(e)
+            return None
+        return {'total': len(rows), 'counters': list(map(lambda x: x[1:], rows[offset:offset + limit]))}
+
+    ### a phrase of the index per word long enough for trigrams, or a LIKE on the names of "@columns"
+    def __searchClause(self, words, index=False):
+        phrases = []
+        clauses = []
+        params = []
+        for word in words:
+            if index and len(word) >= 3:
+                phrases.append('"%s"' % word.replace('"', '""'))
+                continue
+            pattern = '%%%s%%' % re.sub(r'([\\%_])', r'\\\1', word)
+            clauses.append('(main LIKE ? ESCAPE \'\\\' OR sub LIKE ? ESCAPE \'\\\' OR counter LIKE ? ESCAPE \'\\\')')
+            params += [ pattern ] * 3
+        if len(phrases) > 0:
+            clauses.insert(0, 'idx IN (SELECT rowid FROM "@search" WHERE "@search" MATCH ?)')
+            params.insert(0, ' '.join(phrases))
+        if len(clauses) == 0:
+            return ('', params)
+        return (' WHERE ' + ' AND '.join(clauses), params)
+
     def getDatabaseTableName(self, main, sub, check=False):
         if not self.__valid:
             return None
@@ -290,6 +600,12 @@ class DbMeta:
             return '%s(%s)' % (main, sub)
 
     def __save(self):
+        with metrics.phase('serialize'):
+            return self.__saveMeta()
+
+    def __saveMeta(self):
+        if not self.__loadColumns():
+            return False
         try:
             with open(self.__resource, 'w') as fp:
                 json.dump({
@@ -298,14 +614,137 @@ class DbMeta:
                     'date'      : self.__date,
                     'columns'   : self.__columns,
                     'first'     : self.__first,
-                    'last'      : self.__last
+                    'last'      : self.__last,
+                    'rollups'   : self.__rollups or [],
+                    'backend'   : self.__backend or 'sqlite'
                 }, fp)
         except Exception as e:
             logger.error(e)
             return False
+        return self.__saveCatalog()
+
+    ### rewritten as a whole, or only the rows of the counters updated since the catalog was loaded or saved,
+    ### the .db is created by Database after the first save
+    def __saveCatalog(self):
+        dbFile = self.__resource.replace('.inf', '.db')
+        if not os.path.exists(dbFile):
+            return True
+        #
+        meta = {
+            'name'      : self.__name,
+            'version'   : self.__version,
+            'date'      : self.__date,
+            'first'     : self.__first,
+            'last'      : self.__last,
+            'rollups'   : self.__rollups or [],
+            'backend'   : self.__backend or 'sqlite'
+        }
+        try:
+            db = sqlite3.connect(dbFile)
+            try:
+                db.execute('CREATE TABLE IF NOT EXISTS "@meta" (key TEXT PRIMARY KEY, value TEXT)')
+                db.execute('DELETE FROM "@meta"')
+                db.executemany('INSERT INTO "@meta" VALUES (?,?)', list(map(lambda x: (x[0], json.dumps(x[1])), meta.items())))
+                if self.__isCatalogUpdatable(db):
+                    rows = self.__catalogRows(self.__touched)
+                    db.executemany('UPDATE "@columns" SET %s WHERE main = ? AND sub = ? AND counter = ?' % ','.join(list(map(lambda x: '"%s" = ?' % (x), STATISTICS))),
+                                   list(map(lambda x: x[4:] + x[:3], rows)))
+                    db.executemany('INSERT OR REPLACE INTO "@rankings" VALUES (?,?,?,?,?,?)', self.__rankings(rows))
+                    db.commit()
+                else:
+                    rows = self.__catalogRows()
+                    # recreated, as catalogs of older converters may have less statistics
+                    db.execute('DROP TABLE IF EXISTS "@columns"')
+                    db.execute('CREATE TABLE "@columns" (main TEXT, sub TEXT, counter TEXT, idx INTEGER, %s, PRIMARY KEY (main, sub, counter)) WITHOUT ROWID' % ','.join(list(map(lambda x: '"%s" NUMERIC' % (x), STATISTICS))))
+                    db.execute('CREATE INDEX "@columns.idx" ON "@columns" (idx)')
+                    db.execute('DROP TABLE IF EXISTS "@rankings"')
+                    db.execute('CREATE TABLE "@rankings" (score TEXT, value REAL, idx INTEGER, main TEXT, sub TEXT, counter TEXT, PRIMARY KEY (score, idx)) WITHOUT ROWID')
+                    db.execute('CREATE INDEX "@rankings.value" ON "@rankings" (score, value DESC, idx)')
+                    db.executemany('INSERT INTO "@columns" VALUES (%s)' % ','.join(['?'] * (4 + len(STATISTICS))), rows)
+                    db.executemany('INSERT INTO "@rankings" VALUES (?,?,?,?,?,?)', self.__rankings(rows))
+                    db.commit()
+                    self.__saveSearchIndex(db, rows)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(e)
+            return False
+        self.__touched = set()
+        return True
+
+    ### catalogs of older converters have less statistics or ranks instead of values to order
+    def __isCatalogUpdatable(self, db):
+        if self.__touched is None:
+            return False
+        columns = list(map(itemgetter(1), db.execute('PRAGMA table_info("@columns")').fetchall()))
+        rankings = list(map(itemgetter(1), db.execute('PRAGMA table_info("@rankings")').fetchall()))
+        return all(map(lambda x: x in columns, STATISTICS)) and len(rankings) > 0 and 'rank' not in rankings
+
+    ### [main, sub, counter, index, statistics...] of all the columns or of the (main, sub, counter) keys
+    def __catalogRows(self, keys=None):
+        rows = []
+        if keys is None:
+            for (main, subs) in self.__columns.items():
+                for (sub, counters) in subs.items():
+                    for (counter, column) in counters.items():
+                        rows.append([ main, sub, counter, column['index'] ] + list(map(lambda x: column.get(x), STATISTICS)))
+        else:
+            for (main, sub, counter) in sorted(keys):
+                column = self.__columns[main][sub][counter]
+                rows.append([ main, sub, counter, column['index'] ] + list(map(lambda x: column.get(x), STATISTICS)))
+        return rows
+
+    ### (score, value, index, main, sub, counter) of the rows of the catalog for each score,
+    ### ranked by the value and then by the index when they are read
+    def __rankings(self, rows):
+        result = []
+        for score in SCORES:
+            for row in rows:
+                result.append((score, scoreOfColumn(dict(zip(STATISTICS, row[4:])), score), row[3], row[0], row[1], row[2]))
+        return result
+
+    ### rowid of the index is the column index, sqlite without fts5 or its trigram tokenizer (3.34.0)
+    ### is searched by a scan of "@columns"
+    def __saveSearchIndex(self, db, rows):
+        try:
+            db.execute('DROP TABLE IF EXISTS "@search"')
+            db.execute('CREATE VIRTUAL TABLE "@search" USING fts5(main, sub, counter, tokenize = \'trigram\')')
+            db.executemany('INSERT INTO "@search" (rowid, main, sub, counter) VALUES (?,?,?,?)', list(map(lambda x: (x[3], x[0], x[1], x[2]), rows)))
+            db.commit()
+        except sqlite3.OperationalError as e:
+            logger.warning('No search index of counters. - %s' % e)
+            db.rollback()
+            return False
         return True
 
-    def __load(self):
+    ### the catalog of the .db if any, or the json of the .inf of older conversions
+    def __load(self, db=None):
+        dbFile = self.__resource.replace('.inf', '.db')
+        if db is not None or os.path.exists(dbFile):
+            try:
+                catalog = db if db is not None else sqlite3.connect(dbFile)
+            except Exception as e:
+                logger.error(e)
+                catalog = None
+            try:
+                if catalog is not None:
+                    meta = dict(map(lambda x: (x[0], json.loads(x[1])), catalog.execute('SELECT key, value FROM "@meta"').fetchall()))
+                    self.__name     = meta['name']
+                    self.__version  = meta['version']
+                    self.__date     = meta['date']
+                    self.__first    = meta['first']
+                    self.__last     = meta['last']
+                    self.__rollups  = meta.get('rollups', [])
+                    self.__backend  = meta.get('backend', 'sqlite')
+                    self.__catalog  = catalog
+                    self.__shared   = db is not None
+                    self.__touched  = set()
+                    self.__valid    = True
+                    return True
+            except (sqlite3.Error, KeyError):
+                if db is None:
+                    catalog.close()
+        #
         if not os.path.exists(self.__resource):
             return False
         try:
@@ -317,12 +756,36 @@ class DbMeta:
                 self.__columns  = meta['columns']
                 self.__first    = meta['first']
                 self.__last     = meta['last']
+                self.__rollups  = meta.get('rollups', [])
+                self.__backend  = meta.get('backend', 'sqlite')
                 self.__valid    = True
         except Exception as e:
             logger.error(e)
             return False
         return True
 
+    ### the whole columns dict from the catalog
+    def __loadColumns(self):
+        if not self.__lazy():
+            return True
+        #
+        columns = {}
+        try:
+            # catalogs of older converters may have less statistics
+            cursor = self.__catalog.execute('SELECT * FROM "@columns" ORDER BY idx')
+            keys = list(map(itemgetter(0), cursor.description))
+            for row in cursor.fetchall():
+                values = dict(zip(keys, row))
+                column = { 'name': values['counter'], 'index': values['idx'] }
+                column.update(map(lambda x: (x, values[x]), filter(lambda x: x in values, STATISTICS)))
+                columns.setdefault(values['main'], {}).setdefault(values['sub'], {})[values['counter']] = column
+        except Exception as e:
+            logger.error(e)
+            return False
+        self.__columns = columns
+        self.__close()
+        return True
+
     def update(self):
         if self.__update:
             self.__update = False
@@ -339,12 +802,22 @@ class Database:
     __date      = None
     __db        = None
     __cursor    = None
+    __statements= None
+    __buffers   = None
+    __mode      = None
+    __store     = None
 
     def __init__(self, dbFile, date=True):
         self.__resouce = dbFile
-        self.__meta = DbMeta(dbFile.replace('.db', '.inf'))
         self.__date = date
+        self.__statements = {}
+        self.__buffers = {}
         self.__connect()
+        self.__meta = DbMeta(dbFile.replace('.db', '.inf'), db=self.__db)
+        if self.__meta.getBackend() == 'column':
+            self.__store = ColumnStore(dbFile.replace('.db', '.col'))
+        if self.__meta.getVersion() is not None and self.__meta.getVersion() < DB_VERSION:
+            self.__migrate()
         pass
 
     def __del__(self):
@@ -359,7 +832,7 @@ class Database:
         if self.__resouce is None:
             return False
         try:
-            self.__db = sqlite3.connect(self.__resouce)
+            self.__db = sqlite3.connect(self.__resouce, timeout=LOCK_TIMEOUT)
             self.__cursor = self.__db.cursor()
         except Exception as e:
             logger.error(e)
@@ -369,6 +842,10 @@ class Database:
     def commit(self):
         if self.__db is None:
             return False
+        if not self.flush():
+            return False
+        if self.__store is not None and not self.__store.flush():
+            return False
         try:
             self.__db.commit()
         except Exception as e:
@@ -385,6 +862,45 @@ class Database:
     def updateColumn(self, main, sub, counter, key, value):
         return self.__meta.updateColumn(main, sub, counter, key, value)
 
+    def getColumns(self):
+        return self.__meta.getColumns()
+
+    def getLast(self):
+        return self.__meta.getLast()
+
+    def updateLast(self, last):
+        return self.__meta.updateLast(last)
+
+    def getRollups(self):
+        return self.__meta.getRollups()
+
+    def getBackend(self):
+        return self.__meta.getBackend()
+
+    def updateRollups(self, rollups):
+        return self.__meta.updateRollups(rollups)
+
+    ### a rollup keeps 4 columns per counter, so a wide group is split into blocks under the column limit of sqlite
+    def getRollupTableName(self, table, interval, block=0):
+        return '%s@%d' % (table, interval) if block == 0 else '%s@%d#%d' % (table, interval, block)
+
+    def getRollupBlocks(self, cols):
+        return [ cols[i:i + ROLLUP_BLOCK] for i in range(0, len(cols), ROLLUP_BLOCK) ]
+
+    ### the coarsest rollup which still has 2 points (min and max) per bucket for the budget
+    def getRollupInterval(self, first, last, maxPoints):
+        first = parseDate(first or self.__meta.getFirst())
+        last = parseDate(last or self.__meta.getLast())
+        if first is None or last is None:
+            return None
+        #
+        seconds = (last - first).total_seconds()
+        result = None
+        for interval in sorted(self.getRollups()):
+            if seconds / interval * 2 >= maxPoints:
+                result = interval
+        return result
+
     def getColumnMainGroups(self):
         return self.__meta.getColumnMainGroups()
 
@@ -400,12 +916,16 @@ class Database:
     def getColumnNonzeroCounters(self):
         return self.__meta.getColumnNonzeroCounters()
 
-    def getColumnVitalityCounters(self, top=10):
-        return self.__meta.getColumnVitalityCounters(top=top)
+    def getColumnVitalityCounters(self, top=VITALITY_TOP, score='variance', groupTop=None):
+        return self.__meta.getColumnVitalityCounters(top=top, score=score, groupTop=groupTop)
+
+    def searchCounters(self, query, offset=0, limit=SEARCH_LIMIT):
+        return self.__meta.searchCounters(query, offset=offset, limit=limit)
 
     def getDatabaseTableName(self, main, sub):
         return self.__meta.getDatabaseTableName(main, sub)
 
+    ### date is epoch seconds as the rowid, so that rows are stored and searched in time order
     def createTable(self, table, cols):
         if self.__db is None or self.__cursor is None:
             return False
@@ -414,130 +934,393 @@ class Database:
             columns = ','.join(list(map(lambda x: '"%s" NUMERIC' % (x), cols)))
             self.__cursor.execute('DROP TABLE if exists "%s"' % (table))
             if self.__date:
-                self.__cursor.execute('CREATE TABLE "%s" (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, %s)' % (table, columns))
+                self.__cursor.execute('CREATE TABLE "%s" (date INTEGER PRIMARY KEY, %s)' % (table, columns))
             else:
-                self.__cursor.execute('CREATE TABLE "%s" (id INTEGER PRIMARY KEY AUTOINCREMENT, %s)' % (table, columns))
+                self.__cursor.execute('CREATE TABLE "%s" (id INTEGER PRIMARY KEY, %s)' % (table, columns))
         except Exception as e:
             logger.error(e)
             return False
         return True
 
-    def insertData(self, table, cols, data):
+    ### tables of version 1 keyed by an autoincrement id with text dates, rebuilt in place in one transaction
+    ### under the write lock, so that a failure or another process migrating at the same time leaves either
+    ### version, and the tables renamed to "<table>@1" by an interrupted migration of older converters are resumed
+    def __migrate(self):
+        if self.__db is None or self.__cursor is None:
+            return False
+        #
+        logger.info('Migrate the database to version %d. - %s' % (DB_VERSION, self.__resouce))
+        isolation = self.__db.isolation_level
+        try:
+            self.__db.isolation_level = None
+            self.__cursor.execute('PRAGMA busy_timeout = %d' % (MIGRATE_TIMEOUT * 1000))
+            self.__cursor.execute('BEGIN IMMEDIATE')
+            if self.__date and self.__store is None:
+                for main in self.getColumnMainGroups():
+                    for sub in self.getColumnSubGroups(main):
+                        if not self.__migrateTable(self.getDatabaseTableName(main, sub), self.getColumnCounters(main, sub)):
+                            self.__db.rollback()
+                            return False
+                if len(self.__cursor.execute('SELECT name FROM sqlite_master WHERE name = \'sqlite_sequence\'').fetchall()) > 0:
+                    self.__cursor.execute('DELETE FROM sqlite_sequence')
+            self.__cursor.execute('COMMIT')
+        except Exception as e:
+            logger.error(e)
+            if self.__db.in_transaction:
+                self.__db.rollback()
+            return False
+        finally:
+            self.__db.isolation_level = isolation
+            self.__cursor.execute('PRAGMA busy_timeout = %d' % (LOCK_TIMEOUT * 1000))
+        # the space of the old tables is given back if no other process is reading
+        try:
+            self.__cursor.execute('VACUUM')
+        except Exception as e:
+            logger.warning('Database not vacuumed. - %s' % e)
+        self.__meta.updateVersion(DB_VERSION)
+        return self.__meta.update()
+
+    ### a table of version 1, or renamed to "<table>@1" already, rebuilt with its rollups,
+    ### while a table of the current version, e.g. migrated by another process, is left as it is
+    def __migrateTable(self, table, cols):
+        old = '%s@%d' % (table, 1)
+        if len(self.__cursor.execute('SELECT name FROM sqlite_master WHERE type = \'table\' AND name = ?', (old,)).fetchall()) == 0:
+            keys = list(map(itemgetter(1), self.__cursor.execute('PRAGMA table_info("%s")' % (table)).fetchall()))
+            if 'id' not in keys:
+                return True
+            self.__cursor.execute('ALTER TABLE "%s" RENAME TO "%s"' % (table, old))
+        for interval in self.getRollups():
+            for block in range(len(self.getRollupBlocks(cols))):
+                self.__cursor.execute('DROP TABLE if exists "%s"' % (self.getRollupTableName(table, interval, block)))
+        if not self.createTable(table, cols):
+            return False
+        columns = ','.join(list(map(lambda x: '"%s"' % (x), cols)))
+        self.__cursor.execute('INSERT OR REPLACE INTO "%s" (date,%s) SELECT CAST(strftime(\'%%s\', date) AS INTEGER),%s FROM "%s" ORDER BY id' % (table, columns, columns, old))
+        # a date repeated by the csv, e.g. at the end of daylight saving time, keeps the later row as a conversion does
+        dropped = self.__cursor.execute('SELECT (SELECT count(*) FROM "%s") - (SELECT count(*) FROM "%s")' % (old, table)).fetchone()[0]
+        if dropped > 0:
+            logger.warning('Rows of repeated dates replaced by the later ones. - %s, %d rows' % (table, dropped))
+        self.__cursor.execute('DROP TABLE "%s"' % (old))
+        for interval in self.getRollups():
+            if not self.createRollupTable(table, cols, interval):
+                return False
+        return True
+
+    def beginLoad(self, mode='safe'):
+        if self.__db is None or self.__cursor is None:
+            return False
+        if mode not in LOAD_MODES:
+            logger.error('Unknown load mode. - %s' % mode)
+            return False
+        #
+        try:
+            for (key, value) in LOAD_MODES[mode]:
+                self.__cursor.execute('PRAGMA %s = %s' % (key, value))
+        except Exception as e:
+            logger.error(e)
+            return False
+        self.__mode = mode
+        return True
+
+    def endLoad(self):
         if self.__db is None or self.__cursor is None:
             return False
+        if not self.commit():
+            return False
+        # back to the durable settings for the following accesses
+        try:
+            if self.__mode != 'safe':
+                for (key, value) in LOAD_MODES['safe']:
+                    self.__cursor.execute('PRAGMA %s = %s' % (key, value))
+        except Exception as e:
+            logger.error(e)
+            return False
+        self.__mode = None
+        return True
+
+    ### copies all tables of another database, e.g. a shard of the parallel conversion
+    def mergeDatabase(self, dbFile):
+        if self.__db is None or self.__cursor is None:
+            return False
+        if not self.commit():
+            return False
         #
         try:
+            self.__cursor.execute('ATTACH DATABASE ? AS shard', (dbFile,))
+            tables = self.__cursor.execute('SELECT name, sql FROM shard.sqlite_master WHERE type = \'table\' AND name NOT LIKE \'sqlite_%\' AND name NOT LIKE \'@%\'').fetchall()
+            for (table, sql) in tables:
+                self.__cursor.execute('DROP TABLE if exists main."%s"' % (table))
+                self.__cursor.execute(sql)
+                self.__cursor.execute('INSERT INTO main."%s" SELECT * FROM shard."%s"' % (table, table))
+            self.__db.commit()
+            self.__cursor.execute('DETACH DATABASE shard')
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+    def __prepareInsert(self, table, cols):
+        statement = self.__statements.get(table)
+        if statement is None:
             columns = ','.join(list(map(lambda x: '"%s"' % (x), cols)))
-            values = ','.join(data)
             if self.__date:
-                self.__cursor.execute('INSERT INTO "%s" (date,%s) VALUES (%s)' % (table, columns, values))
+                # a date repeated by the csv, e.g. at the end of daylight saving time, keeps the later row
+                statement = 'INSERT OR REPLACE INTO "%s" (date,%s) VALUES (CAST(strftime(\'%%s\', ?) AS INTEGER),%s)' % (table, columns, ','.join(['?'] * len(cols)))
             else:
-                self.__cursor.execute('INSERT INTO "%s" (%s) VALUES (%s)' % (table, columns, values))
+                statement = 'INSERT INTO "%s" (%s) VALUES (%s)' % (table, columns, ','.join(['?'] * len(cols)))
+            self.__statements[table] = statement
+            self.__buffers[table] = []
+        return statement
+
+    ### rows are buffered per table and written by executemany every COMMIT_SIZE rows
+    def insertData(self, table, cols, data):
+        if self.__db is None or self.__cursor is None:
+            return False
+        #
+        self.__prepareInsert(table, cols)
+        buffer = self.__buffers[table]
+        buffer.append(data)
+        if len(buffer) >= COMMIT_SIZE:
+            return self.commit()
+        return True
+
+    ### [(table, statement, getter of the column indexes, buffer), ...] compiled once before loading
+    def createLoadPlan(self, append=False):
+        if self.__store is not None:
+            indexes = []
+            for main in self.getColumnMainGroups():
+                for sub in self.getColumnSubGroups(main):
+                    indexes.extend(self.getColumnCounters(main, sub, key='index'))
+            return indexes if self.__store.create(indexes, append=append) else None
+        #
+        plan = []
+        for main in self.getColumnMainGroups():
+            for sub in self.getColumnSubGroups(main):
+                table = self.getDatabaseTableName(main, sub)
+                indexes = self.getColumnCounters(main, sub, key='index')
+                if self.__date:
+                    indexes = [0] + indexes
+                if len(indexes) == 0:
+                    continue
+                statement = self.__prepareInsert(table, self.getColumnCounters(main, sub))
+                getter = itemgetter(*indexes) if len(indexes) > 1 else (lambda x, i=indexes[0]: (x[i],))
+                plan.append((table, statement, getter, self.__buffers[table]))
+        return plan
+
+    def insertPlannedData(self, plan, data):
+        if self.__db is None or self.__cursor is None:
+            return False
+        if self.__store is not None:
+            return self.__store.append(data)
+        #
+        buffer = None
+        for (table, statement, getter, buffer) in plan:
+            buffer.append(getter(data))
+        if buffer is not None and len(buffer) >= COMMIT_SIZE:
+            return self.commit()
+        return True
+
+    def flush(self):
+        if self.__db is None or self.__cursor is None:
+            return False
+        #
+        try:
+            for (table, buffer) in self.__buffers.items():
+                if len(buffer) > 0:
+                    self.__cursor.executemany(self.__statements[table], buffer)
+                    del buffer[:]
         except Exception as e:
             logger.error(e)
             return False
         return True
 
+    ### first and last are ISO 8601 dates in UTC, which sort as stored
     def selectData(self, table, cols, first=None, last=None):
-        if self.__db is None or self.__cursor is None:
-            return []
+        return list(self.iterData(table, cols, first=first, last=last))
+
+    ### rows of selectData fetched by size through a cursor of their own
+    def iterData(self, table, cols, first=None, last=None, size=CHUNK_SIZE):
+        if self.__db is None:
+            return
         #
+        cursor = self.__db.cursor()
         try:
             columns = ','.join(list(map(lambda x: '"%s"' % (x), cols)))
             if self.__date:
-                self.__cursor.execute('SELECT date,%s FROM "%s"' % (columns, table))
+                conditions = []
+                params = []
+                if first:
+                    conditions.append('date >= ?')
+                    params.append(toEpoch(first))
+                if last:
+                    conditions.append('date <= ?')
+                    params.append(toEpoch(last))
+                where = (' WHERE %s' % ' AND '.join(conditions)) if len(conditions) > 0 else ''
+                cursor.execute('SELECT strftime(\'%%Y-%%m-%%dT%%H:%%M:%%SZ\', date, \'unixepoch\'),%s FROM "%s"%s ORDER BY date' % (columns, table, where), params)
             else:
-                self.__cursor.execute('SELECT %s FROM "%s"' % (columns, table))
+                cursor.execute('SELECT %s FROM "%s"' % (columns, table))
         except Exception as e:
             logger.error(e)
-            return []
+            cursor.close()
+            return
         #
-        result = []
-        for row in self.__cursor.fetchall():
-            data = {}
-            base = 0
-            if self.__date:
-                date = row[0]
-                # TODO
-                #if not inTime(date, first, last):
-                #    continue
-                data['date'] = date
-                base = 1
-            for index, col in enumerate(cols):
-                data[table + '_' + col] = row[index + base]
-            result.append(data)
-        return result
+        keys = ([ 'date' ] if self.__date else []) + list(map(lambda x: table + '_' + x, cols))
+        try:
+            while True:
+                rows = cursor.fetchmany(size)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield dict(zip(keys, row))
+        finally:
+            cursor.close()
+        return
 
-    def countOfData(self, table, cols):
-        if self.__db is None or self.__cursor is None:
-            return []
+    ### buckets of the interval holding min/max/avg/last of each counter, built from the loaded table
+    ### or only rebuilt from the bucket of since, e.g. the last date before appending
+    def createRollupTable(self, table, cols, interval, since=None):
+        if self.__db is None or self.__cursor is None or not self.__date:
+            return False
         #
+        start = toEpoch(since) // interval * interval if since else None
+        bucket = '(date / %d) * %d' % (interval, interval)
         try:
-            columns = ','.join(list(map(lambda x: 'count("%s")' % (x), cols)))
-            self.__cursor.execute('SELECT %s FROM "%s"' % (columns, table))
+            for (block, blockCols) in enumerate(self.getRollupBlocks(cols)):
+                rollup = self.getRollupTableName(table, interval, block)
+                columns = ','.join(list(map(lambda x: '"%s:min" NUMERIC,"%s:max" NUMERIC,"%s:avg" NUMERIC,"%s:last" NUMERIC' % (x, x, x, x), blockCols)))
+                aggregates = ','.join(list(map(lambda x: 'min("%s") AS "%s:min",max("%s") AS "%s:max",avg("%s") AS "%s:avg"' % (x, x, x, x, x, x), blockCols)))
+                values = ','.join(list(map(lambda x: 'g."%s:min",g."%s:max",g."%s:avg",t."%s"' % (x, x, x, x), blockCols)))
+                if start is None:
+                    self.__cursor.execute('DROP TABLE if exists "%s"' % (rollup))
+                    self.__cursor.execute('CREATE TABLE "%s" (date INTEGER PRIMARY KEY, %s)' % (rollup, columns))
+                else:
+                    self.__cursor.execute('DELETE FROM "%s" WHERE date >= ?' % (rollup), (start,))
+                # the last value of a bucket is picked up by joining its latest date
+                self.__cursor.execute(
+                    'INSERT INTO "%s" SELECT g.bucket,%s ' % (rollup, values) +
+                    'FROM (SELECT %s AS bucket,max(date) AS last,%s FROM "%s"%s GROUP BY bucket) g ' % (bucket, aggregates, table, ' WHERE date >= ?' if start is not None else '') +
+                    'JOIN "%s" t ON t.date = g.last ORDER BY g.bucket' % (table),
+                    (start,) if start is not None else ()
+                )
         except Exception as e:
             logger.error(e)
-            return []
-        #
-        result = []
-        for row in self.__cursor.fetchall():
-            for index in range(len(cols)):
-                result.append(row[index])
-        return result
+            return False
+        return True
 
-    def sumOfData(self, table, cols):
-        if self.__db is None or self.__cursor is None:
+    def selectColumnData(self, main, sub, cols, first=None, last=None):
+        if self.__store is None:
             return []
         #
-        try:
-            columns = ','.join(list(map(lambda x: 'total("%s")' % (x), cols)))
-            self.__cursor.execute('SELECT %s FROM "%s"' % (columns, table))
-        except Exception as e:
-            logger.error(e)
+        table = self.getDatabaseTableName(main, sub)
+        indexes = dict(zip(self.getColumnCounters(main, sub), self.getColumnCounters(main, sub, key='index')))
+        (dates, lo, hi) = self.__store.selectDates(first=first, last=last)
+        if dates is None:
             return []
         #
-        result = []
-        for row in self.__cursor.fetchall():
-            for index in range(len(cols)):
-                result.append(row[index])
+        result = list(map(lambda x: {'date': x}, dates))
+        for col in cols:
+            if col not in indexes:
+                continue
+            values = self.__store.selectValues(indexes[col], lo, hi)
+            if values is None:
+                return []
+            key = table + '_' + col
+            for (data, value) in zip(result, values):
+                data[key] = None if value != value else value
         return result
 
-    def averageOfData(self, table, cols):
-        if self.__db is None or self.__cursor is None:
+    ### each bucket is returned as 2 rows, the minimums at its start and the maximums at its end
+    def selectRollupData(self, main, sub, cols, interval, first=None, last=None):
+        if self.__db is None or self.__cursor is None or not self.__date:
             return []
         #
-        counts = self.countOfData(table, cols)
-        sums = self.sumOfData(table, cols)
-        if len(counts) != len(cols) or len(sums) != len(cols):
+        table = self.getDatabaseTableName(main, sub)
+        # the requested counters by the rollup block holding them
+        blocks = OrderedDict()
+        for (block, blockCols) in enumerate(self.getRollupBlocks(self.getColumnCounters(main, sub))):
+            for col in cols:
+                if col in blockCols:
+                    blocks.setdefault(block, []).append(col)
+        if len(blocks) == 0:
             return []
         #
-        result = []
-        for index in range(len(cols)):
-            result.append(sums[index] / counts[index])
+        end = "strftime('%Y-%m-%dT%H:%M:%SZ', date + " + str(interval - 1) + ", 'unixepoch')"
+        conditions = []
+        params = []
+        if first:
+            conditions.append('date >= ?')
+            params.append(toEpoch(first) // interval * interval)
+        if last:
+            conditions.append('date <= ?')
+            params.append(toEpoch(last))
+        where = (' WHERE %s' % ' AND '.join(conditions)) if len(conditions) > 0 else ''
+        result = None
+        try:
+            for (block, blockCols) in blocks.items():
+                rollup = self.getRollupTableName(table, interval, block)
+                columns = ','.join(list(map(lambda x: '"%s:min","%s:max"' % (x, x), blockCols)))
+                self.__cursor.execute('SELECT strftime(\'%%Y-%%m-%%dT%%H:%%M:%%SZ\', date, \'unixepoch\'),%s,%s FROM "%s"%s ORDER BY date' % (end, columns, rollup, where), params)
+                rows = self.__cursor.fetchall()
+                if result is None:
+                    result = []
+                    for row in rows:
+                        result.append({'date': row[0]})
+                        result.append({'date': row[1]})
+                # the blocks share the buckets of the same table
+                for (index, row) in enumerate(rows):
+                    head = result[index * 2]
+                    tail = result[index * 2 + 1]
+                    for (i, col) in enumerate(blockCols):
+                        head[table + '_' + col] = row[2 + i * 2]
+                        tail[table + '_' + col] = row[3 + i * 2]
+        except Exception as e:
+            logger.error(e)
+            return []
         return result
 
-    def varianceOfData(self, table, cols):
+    ### blocks of COLUMN_BLOCK columns, as a 2-D float array with numpy or as lists of numeric values,
+    ### of the rows after since if any
+    def __columnBlocks(self, table, cols, indexes=None, since=None):
+        if self.__store is not None:
+            size = self.__store.countDates()
+            start = self.__store.countDates(last=since) if since else 0
+        for offset in range(0, len(cols), COLUMN_BLOCK):
+            block = cols[offset:offset + COLUMN_BLOCK]
+            if self.__store is not None:
+                values = list(map(lambda x: self.__store.selectValues(x, start, size), indexes[offset:offset + COLUMN_BLOCK]))
+                if numpy is not None:
+                    yield numpy.column_stack(list(map(lambda x: numpy.frombuffer(x, dtype=numpy.float64), values)))
+                else:
+                    yield list(map(lambda x: list(filter(lambda y: y == y, x)), values))
+                continue
+            #
+            columns = ','.join(list(map(lambda x: '"%s"' % (x), block)))
+            if since and self.__date:
+                self.__cursor.execute('SELECT %s FROM "%s" WHERE date > ?' % (columns, table), (toEpoch(since),))
+            else:
+                self.__cursor.execute('SELECT %s FROM "%s"' % (columns, table))
+            rows = self.__cursor.fetchall()
+            if numpy is not None:
+                try:
+                    yield numpy.array(rows, dtype=numpy.float64).reshape(len(rows), len(block))
+                except (TypeError, ValueError):
+                    yield numpy.array(list(map(lambda x: list(map(toFloat, x)), rows)), dtype=numpy.float64).reshape(len(rows), len(block))
+            else:
+                yield list(map(lambda x: list(filter(lambda y: isinstance(y, (int, float)), x)), zip(*rows))) if len(rows) > 0 else [ [] for col in block ]
+
+    ### [{'count', 'average', 'variance', 'min', 'max', 'p<N>'..., 'changes'}, ...] for each column in one scan
+    ### of the rows after since if any, without the moments (average, variance, min and max) unless moments
+    def summaryOfData(self, table, cols, indexes=None, percents=[], since=None, moments=True):
         if self.__db is None or self.__cursor is None:
             return []
         #
-        counts = self.countOfData(table, cols)
-        avgs = self.averageOfData(table, cols)
-        if len(counts) != len(cols) or len(avgs) != len(cols):
-            return []
-        #
-        columns = ','.join(list(map(lambda x: '"%s"' % (x), cols)))
+        result = []
         try:
-            self.__cursor.execute('SELECT %s FROM "%s"' % (columns, table))
+            for block in self.__columnBlocks(table, cols, indexes=indexes, since=since):
+                result.extend(summarizeColumns(block, percents, moments=moments))
         except Exception as e:
             logger.error(e)
             return []
-        #
-        result = [ 0 for i in range(len(cols)) ]
-        for row in self.__cursor.fetchall():
-            for index in range(len(cols)):
-                result[index] = result[index] + pow(row[index] - avgs[index], 2)
-        for index in range(len(cols)):
-            result[index] = result[index] / counts[index]
         return result
 
     def __decodeCounters(self, counters):
@@ -552,43 +1335,218 @@ class Database:
                 })
         return result
 
-    def selectMultiData(self, counters, first=None, last=None):
-        result = None
+    def selectMultiData(self, counters, first=None, last=None, interval=None, fill='null'):
+        if len(self.__decodeCounters(counters)) == 0:
+            return None
+        return list(self.iterMultiData(counters, first=first, last=last, interval=interval, fill=fill))
+
+    ### keys of the rows of selectMultiData but the date, of the known counters
+    def getMultiDataKeys(self, counters):
+        keys = []
         for counter in self.__decodeCounters(counters):
-            result = margeDictList(result, self.selectData(self.__meta.getDatabaseTableName(counter['main'], counter['sub']), counter['counters'], first=first, last=last))
-        return result
+            keys.extend(self.__keysOfCounter(counter))
+        return keys
+
+    def __keysOfCounter(self, counter):
+        table = self.__meta.getDatabaseTableName(counter['main'], counter['sub'])
+        known = self.getColumnCounters(counter['main'], counter['sub']) or []
+        return list(map(lambda x: table + '_' + x, filter(lambda x: x in known, counter['counters'])))
+
+    ### rows of selectMultiData, streamed from the cursors of the tables with the sqlite backend
+    def iterMultiData(self, counters, first=None, last=None, interval=None, fill='null'):
+        series = []
+        keys = []
+        for counter in self.__decodeCounters(counters):
+            table = self.__meta.getDatabaseTableName(counter['main'], counter['sub'])
+            if self.__store is not None:
+                data = iter(self.selectColumnData(counter['main'], counter['sub'], counter['counters'], first=first, last=last))
+            elif interval:
+                data = iter(self.selectRollupData(counter['main'], counter['sub'], counter['counters'], interval, first=first, last=last))
+            else:
+                data = self.iterData(table, counter['counters'], first=first, last=last)
+            series.append(data)
+            keys.append(self.__keysOfCounter(counter))
+        return series[0] if len(series) == 1 else mergeDictIter(series, fill=fill, keys=keys)
 
 
 ################################################################################
-### Class - Converter
+### Class - Database Pool
 ################################################################################
-class DbConverter:
-    __resource  = None
-    __dbfile    = None
-    __preserve  = None
-    __fp        = None
-    __re_date   = re.compile(r"^([0-9]{2})\/([0-9]{2})\/([0-9]{4}) ([0-9]{2}):([0-9]{2}):([0-9]{2})$")
-    __re_col    = re.compile(r"^([^()]+)\(([^()]+)\)$")
+class DatabasePool:
+    __size      = None
+    __databases = None
 
-    def __init__(self, csvFile, preserve=True):
-        self.__resource = csvFile
-        self.__preserve = preserve
+    def __init__(self, size=POOL_SIZE):
+        self.__size = size
+        self.__databases = OrderedDict()
         pass
 
-    def __del__(self):
-        if self.__fp is not None:
-            self.__fp.close()
-        if not self.__preserve:
+    ### opened databases are kept while both .db and .inf are unchanged
+    def get(self, dbFile):
+        stamp = stampOfDatabase(dbFile)
+        if stamp is None:
+            self.__databases.pop(dbFile, None)
+            return None
+        #
+        entry = self.__databases.get(dbFile)
+        if entry is not None and entry[0] == stamp:
+            self.__databases.move_to_end(dbFile)
+            return entry[1]
+        #
+        database = Database(dbFile)
+        self.__databases[dbFile] = (stamp, database)
+        self.__databases.move_to_end(dbFile)
+        while len(self.__databases) > self.__size:
+            self.__databases.popitem(last=False)
+        return database
+
+
+################################################################################
+### Class - Result Cache
+################################################################################
+### results of getStatsData serialized as gzip json, in memory up to size bytes in LRU order
+### and in <name>.cache next to the .inf of the first database up to disk bytes, named by
+### "<databases>-<stamp>-<query>.json.gz" so that the results of the same databases changed since
+### are never read and removed on the next put
+class ResultCache:
+    __size      = None
+    __disk      = None
+    __entries   = None
+    __used      = 0
+
+    def __init__(self, size=CACHE_SIZE, disk=CACHE_DISK):
+        self.__size = size
+        self.__disk = disk
+        self.__entries = OrderedDict()
+        pass
+
+    ### (databases, stamp, query) hashes, where databases tells the set of files sharing a directory
+    def __key(self, dbFiles, query):
+        stamps = list(map(stampOfDatabase, dbFiles))
+        if None in stamps:
+            return (None, None, None)
+        paths = list(map(os.path.abspath, dbFiles))
+        group = hashlib.sha1(json.dumps(paths).encode('utf-8')).hexdigest()[:16]
+        stamp = hashlib.sha1(json.dumps(stamps).encode('utf-8')).hexdigest()[:16]
+        key = hashlib.sha1(json.dumps([ paths, query ]).encode('utf-8')).hexdigest()
+        return (group, stamp, key)
+
+    def __directory(self, dbFiles):
+        return dbFiles[0].replace('.db', '.cache')
+
+    def get(self, dbFiles, query):
+        (group, stamp, key) = self.__key(dbFiles, query)
+        if key is None:
+            return None
+        #
+        payload = self.__entries.get(stamp + key)
+        if payload is not None:
+            self.__entries.move_to_end(stamp + key)
+        elif self.__disk > 0:
+            path = os.path.join(self.__directory(dbFiles), '%s-%s-%s.json.gz' % (group, stamp, key))
             try:
-                os.remove(self.__resource)
+                if not os.path.exists(path):
+                    return None
+                with open(path, 'rb') as fp:
+                    payload = fp.read()
+                os.utime(path)
             except Exception as e:
                 logger.error(e)
-        pass
-
-    ### "xxx","yyy",\n -> xxx,yyy
-    def __pealLine(self, line):
-        return line.replace('\n', '').replace('"', '').strip(',')
-
+                return None
+            self.__remember(stamp + key, payload)
+        else:
+            return None
+        try:
+            return json.loads(gzip.decompress(payload).decode('utf-8'))
+        except Exception as e:
+            logger.error(e)
+            return None
+
+    def put(self, dbFiles, query, data):
+        (group, stamp, key) = self.__key(dbFiles, query)
+        if key is None:
+            return False
+        #
+        try:
+            payload = gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), compresslevel=1)
+        except Exception as e:
+            logger.error(e)
+            return False
+        self.__remember(stamp + key, payload)
+        if self.__disk > 0:
+            return self.__store(self.__directory(dbFiles), group, stamp, key, payload)
+        return True
+
+    def __remember(self, key, payload):
+        if len(payload) > self.__size:
+            return
+        previous = self.__entries.pop(key, None)
+        if previous is not None:
+            self.__used -= len(previous)
+        self.__entries[key] = payload
+        self.__used += len(payload)
+        while self.__used > self.__size:
+            (_, evicted) = self.__entries.popitem(last=False)
+            self.__used -= len(evicted)
+        return
+
+    ### written through a temporary file as other processes may read the directory
+    def __store(self, dirPath, group, stamp, key, payload):
+        try:
+            if not os.path.exists(dirPath):
+                os.makedirs(dirPath)
+            path = os.path.join(dirPath, '%s-%s-%s.json.gz' % (group, stamp, key))
+            with open(path + '.%d.tmp' % os.getpid(), 'wb') as fp:
+                fp.write(payload)
+            os.replace(path + '.%d.tmp' % os.getpid(), path)
+            # Remove results of the older databases of the same set and the least recently used ones over the limit
+            entries = []
+            for name in os.listdir(dirPath):
+                if name.endswith('.tmp'):
+                    continue
+                entryPath = os.path.join(dirPath, name)
+                if name.startswith(group + '-') and not name.startswith('%s-%s-' % (group, stamp)):
+                    os.remove(entryPath)
+                    continue
+                entries.append((os.path.getmtime(entryPath), os.path.getsize(entryPath), entryPath))
+            used = sum(map(lambda x: x[1], entries))
+            for (mtime, size, entryPath) in sorted(entries):
+                if used <= self.__disk:
+                    break
+                os.remove(entryPath)
+                used -= size
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+
+################################################################################
+### Class - Converter
+################################################################################
+class DbConverter:
+    __resource  = None
+    __dbfile    = None
+    __preserve  = None
+    __reader    = None
+    __re_date   = re.compile(r"^([0-9]{2})\/([0-9]{2})\/([0-9]{4}) ([0-9]{2}):([0-9]{2}):([0-9]{2})$")
+    __re_col    = re.compile(r"^([^()]+)\(([^()]+)\)$")
+
+    def __init__(self, csvFile, preserve=True):
+        self.__resource = csvFile
+        self.__preserve = preserve
+        pass
+
+    def __del__(self):
+        if self.__reader is not None:
+            self.__reader.close()
+        if not self.__preserve:
+            try:
+                os.remove(self.__resource)
+            except Exception as e:
+                logger.error(e)
+        pass
+
     ### MM/DD/YYYY hh:mm:ss -> UTC or YYYYMMDDhhmmss
     def __convertDate(self, date, mode='utc', default='Unknown'):
         match = self.__re_date.match(date)
@@ -600,11 +1558,13 @@ class DbConverter:
         else:
             return '%s-%s-%sT%s:%s:%sZ' % (match.groups()[2], match.groups()[0], match.groups()[1], match.groups()[3], match.groups()[4], match.groups()[5])
 
-    def __extractName(self, line):
-        return line.split(',')[1].split('\\')[2]
+    def __extractName(self, fields):
+        return fields[1].split('\\')[2]
 
-    def __extractDate(self, line, mode='utc', default='Unknown'):
-        return self.__convertDate(line.split(',')[0], mode=mode, default=default)
+    def __extractDate(self, fields, mode='utc', default='Unknown'):
+        if len(fields) == 0:
+            return default
+        return self.__convertDate(fields[0].strip(), mode=mode, default=default)
 
     def __extractColumn(self, col):
         splited = col.split("\\")
@@ -622,124 +1582,894 @@ class DbConverter:
             sub  = 'default'
         return (main, sub, counter)
 
-    def __rewind(self, index=0):
+    def __rewind(self):
         try:
-            if self.__fp is not None:
-                self.__fp.close()
-            self.__fp = open(self.__resource, 'r')
-            for i in range(index):
-                self.__fp.readline()
+            if self.__reader is not None:
+                self.__reader.close()
+            self.__reader = CsvReader(self.__resource)
         except Exception as e:
             logger.error(e)
             return False
         return True
 
-    def __readline(self):
+    ### [date, value, ...], values are float or None
+    def __readdata(self):
         try:
-            if self.__fp is None:
-                self.__fp = open(self.__resource, 'r')
-            line = self.__pealLine(self.__fp.readline())
+            data = self.__reader.readRow()
         except Exception as e:
             logger.error(e)
             return None
-        return line
-
-    def __readdata(self):
-        line = self.__readline()
-        if not line:
+        if data is None:
             return None
-        data = line.split(',')
-        date = self.__convertDate(data[0], default=None)
+        date = self.__convertDate(data[0].strip(), default=None)
         if not date:
             return None
         data[0] = date
         return data
 
-    def createMeta(self):
-        if not self.__rewind():
-            return False
-        #
-        titleLine = self.__readline()
-        firstLine = lastLine = self.__readline()
-        while True:
-            line = self.__readline()
-            if not line:
-                break
-            lastLine = line
-        #
-        name = self.__extractName(titleLine)
-        date = self.__extractDate(firstLine, mode='file')
-        first = self.__extractDate(firstLine)
-        last = self.__extractDate(lastLine)
-        #
+    def __extractColumns(self, titleFields):
         columns = {}
-        colList = titleLine.split(',')[1:]
-        for index, col in enumerate(colList):
+        for index, col in enumerate(titleFields[1:]):
             (main, sub, counter) = self.__extractColumn(col)
             if main is None:
                 continue
             #
-            if main not in list(columns.keys()):
+            if main not in columns:
                 columns[main] = {}
-            if sub not in list(columns[main].keys()):
+            if sub not in columns[main]:
                 columns[main][sub] = {}
             columns[main][sub][counter] = {
                 'name'      : counter,
-                'index'     : index + 1,
-                'average'   : None,
-                'variance'  : None
+                'index'     : index + 1
             }
+            for key in STATISTICS:
+                columns[main][sub][counter][key] = None
+        return columns
+
+    ### the last data line, read backwards from the end of the file or through a compressed stream
+    def __readLastData(self):
+        if detectCompression(self.__resource) is not None:
+            last = None
+            while True:
+                data = self.__readdata()
+                if data is None:
+                    return last
+                last = data[0]
+        #
+        try:
+            with open(self.__resource, 'rb') as fp:
+                fp.seek(0, os.SEEK_END)
+                end = fp.tell()
+                start = max(end - TAIL_SIZE, 0)
+                while True:
+                    fp.seek(start)
+                    lines = fp.read(end - start).decode('utf-8', errors='replace').split('\n')
+                    # the first line may be cut unless the file is read from its head
+                    for line in reversed(lines if start == 0 else lines[1:]):
+                        date = self.__extractDate(next(csv.reader([line]), []), default=None)
+                        if date is not None:
+                            return date
+                    if start == 0:
+                        return None
+                    end = start + len(lines[0].encode('utf-8', errors='replace'))
+                    start = max(start - TAIL_SIZE, 0)
+        except Exception as e:
+            logger.error(e)
+            return None
+
+    ### name, dates and columns from the head and the tail only, without any file written
+    def probeMeta(self):
+        head = self.__readHead()
+        if head is None:
+            return None
+        (name, date, first, columns, data) = head
+        #
+        last = self.__readLastData()
+        if last is None:
+            return None
+        return {
+            'basename'  : '%s_%s_%s' % (name, date, DB_VERSION),
+            'name'      : name,
+            'date'      : date,
+            'first'     : first,
+            'last'      : last,
+            'columns'   : columns
+        }
+
+    def createMeta(self):
+        probe = self.probeMeta()
+        if probe is None:
+            return None
         #
         dirPath = os.path.dirname(self.__resource)
-        meta = DbMeta.create(dirPath, name, date, first, last, columns)
+        meta = DbMeta.create(dirPath, probe['name'], probe['date'], probe['first'], probe['last'], probe['columns'])
         self.__dbfile = os.path.join(dirPath, meta.getResourceName())
         return meta
 
-    def __extractData(self, data, indexes):
-        result = list(map(lambda x: '"%s"' % x, data[:1]))
-        result.extend(sliceByIndex(data, indexes))
+    ### (name, date of file, first date, columns, first data)
+    def __readHead(self):
+        if not self.__rewind():
+            return None
+        #
+        with metrics.phase('header'):
+            try:
+                titleFields = self.__reader.readTitle()
+            except Exception as e:
+                logger.error(e)
+                return None
+            if titleFields is None or len(titleFields) < 2:
+                return None
+            name = self.__extractName(titleFields)
+            columns = self.__extractColumns(titleFields)
+        #
+        data = self.__readdata()
+        if data is None:
+            return None
+        first = data[0]
+        date = re.sub(r'[^0-9]', '', first)
+        return (name, date, first, columns, data)
+
+    ### header, inserts and running statistics in a single read of the csv
+    def createDatabase(self, mode='safe', backend='sqlite', jobs=1):
+        head = self.__readHead()
+        if head is None:
+            return None
+        (name, date, first, columns, data) = head
+        #
+        dirPath = os.path.dirname(self.__resource)
+        if backend not in BACKENDS:
+            logger.error('Unknown backend. - %s' % backend)
+            return None
+        jobs = self.__capJobs(jobs)
+        if jobs > 1 and backend == 'sqlite':
+            database = self.__createDatabaseParallel(dirPath, name, date, first, columns, mode, jobs)
+        else:
+            meta = DbMeta.create(dirPath, name, date, first, first, columns, backend=backend)
+            self.__dbfile = os.path.join(dirPath, meta.getResourceName())
+            database = self.__fillDatabase(self.__dbfile + '.db', data, mode, backend)
+        # a half-built database is not left behind to be picked up later, e.g. by appending
+        if database is None and self.__dbfile is not None:
+            self.__removeDatabase(self.__dbfile)
+        return database
+
+    ### no more workers than cpus, nor than SHARD_SIZE bytes of the csv can keep busy
+    def __capJobs(self, jobs):
+        try:
+            size = os.path.getsize(self.__resource)
+        except Exception as e:
+            logger.error(e)
+            return 1
+        capped = max(min(jobs, os.cpu_count() or 1, size // SHARD_SIZE), 1)
+        if capped < jobs:
+            logger.info('Convert by %d of %d jobs. - %d bytes' % (capped, jobs, size))
+        return capped
+
+    def __removeDatabase(self, dbFile):
+        for path in [ dbFile + '.db', dbFile + '.inf', dbFile + '.col' ]:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except Exception as e:
+                logger.error(e)
+        pass
+
+    ### rows later than the last one of an existing database of the same name and column layout
+    ### are appended to it, a new database is created if there is none
+    def appendDatabase(self, mode='safe', backend='sqlite', jobs=1):
+        head = self.__readHead()
+        if head is None:
+            return None
+        (name, date, first, columns, data) = head
+        #
+        dirPath = os.path.dirname(self.__resource)
+        meta = self.__findMeta(dirPath, name, first, columns)
+        if meta is None:
+            logger.info('No database to append to, create a new one. - %s' % name)
+            return self.createDatabase(mode=mode, backend=backend, jobs=jobs)
+        #
+        self.__dbfile = os.path.join(dirPath, meta.getResourceName())
+        logger.info('Append to the database. - %s' % meta.getResourceName())
+        return self.__fillDatabase(self.__dbfile + '.db', data, mode, meta.getBackend(), append=True)
+
+    ### the latest meta with the layout of columns which does not start after first
+    def __findMeta(self, dirPath, name, first, columns):
+        layout = layoutOfColumns(columns)
+        result = None
+        try:
+            for infFile in sorted(os.listdir(dirPath)):
+                if not infFile.startswith(name + '_') or not infFile.endswith('.inf'):
+                    continue
+                meta = DbMeta(os.path.join(dirPath, infFile))
+                if meta.getName() != name or meta.getFirst() is None or meta.getFirst() > first:
+                    continue
+                if not os.path.exists(os.path.join(dirPath, meta.getResourceName() + '.db')):
+                    continue
+                if layoutOfColumns(meta.getColumns()) != layout:
+                    continue
+                if result is None or meta.getLast() > result.getLast():
+                    result = meta
+        except Exception as e:
+            logger.error(e)
+            return None
         return result
 
-    def createDatabase(self):
-        if self.__dbfile is None:
-            self.createMeta()
+    ### a database of a part of the column groups, see createDatabaseShard
+    def createShard(self, dirPath, name, date, columns, mode='safe'):
+        head = self.__readHead()
+        if head is None:
+            return None
+        (_, _, first, _, data) = head
+        #
+        meta = DbMeta.create(dirPath, name, date, first, first, columns)
+        database = self.__fillDatabase(os.path.join(dirPath, meta.getResourceName() + '.db'), data, mode, 'sqlite')
+        if database is None:
+            return None
+        return os.path.join(dirPath, meta.getResourceName() + '.db')
+
+    def __createDatabaseParallel(self, dirPath, name, date, first, columns, mode, jobs):
+        # Split the column groups into shards of about the same number of counters
+        shards = [ {} for i in range(jobs) ]
+        sizes = [ 0 for i in range(jobs) ]
+        for (size, main, sub) in sorted([ (len(columns[main][sub]), main, sub) for main in columns for sub in columns[main] ], reverse=True):
+            job = sizes.index(min(sizes))
+            shards[job].setdefault(main, {})[sub] = columns[main][sub]
+            sizes[job] += size
+        shards = list(filter(lambda x: len(x) > 0, shards))
+        #
+        start = time.time()
+        try:
+            with multiprocessing.Pool(len(shards)) as pool:
+                results = pool.starmap(createDatabaseShard, [ (self.__resource, dirPath, '%s-shard%d' % (name, job), date, shard, mode) for (job, shard) in enumerate(shards) ])
+        except Exception as e:
+            logger.error(e)
+            return None
+        logger.info('Loaded %d shards in %.3f sec.' % (len(shards), time.time() - start))
+        metrics.addTime('shards', time.time() - start)
+        shardFiles = list(map(itemgetter(0), results))
+        for (shardFile, report) in results:
+            metrics.attach('shards', report)
+        #
+        meta = DbMeta.create(dirPath, name, date, first, first, columns)
+        self.__dbfile = os.path.join(dirPath, meta.getResourceName())
         database = Database(self.__dbfile + '.db')
+        if not database.beginLoad(mode=mode):
+            return None
+        result = True
+        for shardFile in shardFiles:
+            with metrics.phase('merge'):
+                merged = shardFile is not None and database.mergeDatabase(shardFile)
+            if not merged:
+                result = False
+                continue
+            shardMeta = DbMeta(shardFile.replace('.db', '.inf'))
+            for (main, subs) in shardMeta.getColumns().items():
+                for (sub, counters) in subs.items():
+                    for (counter, column) in counters.items():
+                        for key in STATISTICS:
+                            database.updateColumn(main, sub, counter, key, column.get(key))
+            database.updateLast(shardMeta.getLast())
+            database.updateRollups(shardMeta.getRollups())
+        for shardFile in shardFiles:
+            for path in ([ shardFile, shardFile.replace('.db', '.inf') ] if shardFile is not None else []):
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except Exception as e:
+                    logger.error(e)
+        if not result:
+            return None
+        #
+        result = database.endLoad()
+        if not result:
+            return None
+        result = database.update()
+        if not result:
+            return None
+        #
+        return database
+
+    def __fillDatabase(self, dbFile, data, mode, backend, append=False):
+        database = Database(dbFile)
+        since = database.getLast() if append else None
+        # Skip the rows already loaded, e.g. of a growing csv
+        while since is not None and data is not None and data[0] <= since:
+            data = self.__readdata()
+        if data is None:
+            logger.info('No rows to append. - %s' % database.getResourceName())
+            return database
+        if not database.beginLoad(mode=mode):
+            return None
         # Create tables
+        if backend == 'sqlite' and not append:
+            for main in database.getColumnMainGroups():
+                for sub in database.getColumnSubGroups(main):
+                    database.createTable(database.getDatabaseTableName(main, sub), database.getColumnCounters(main, sub))
+        # Insert data into each table
+        plan = database.createLoadPlan(append=append)
+        if plan is None:
+            return None
+        indexes = []
         for main in database.getColumnMainGroups():
             for sub in database.getColumnSubGroups(main):
-                database.createTable(database.getDatabaseTableName(main, sub), database.getColumnCounters(main, sub))
-        # Insert data into each table
-        self.__rewind(index=1)
-        while True:
+                indexes.extend(database.getColumnCounters(main, sub, key='index'))
+        first = last = data[0]
+        rows = 0
+        start = time.time()
+        # timed by the clock in line, as a context per row would cost as much as the insert
+        clock = time.perf_counter
+        (inserting, parsing) = (0.0, 0.0)
+        while data is not None:
+            t0 = clock()
+            if not database.insertPlannedData(plan, data):
+                return None
+            t1 = clock()
+            last = data[0]
+            rows += 1
             data = self.__readdata()
-            if data is None:
-                break
+            t2 = clock()
+            inserting += t1 - t0
+            parsing += t2 - t1
+        metrics.addTime('insert', inserting, calls=rows)
+        metrics.addTime('parse', parsing, calls=rows)
+        metrics.count('rows', rows)
+        metrics.count('bytes', self.__reader.tell())
+        metrics.count('columns', len(indexes))
+        with metrics.phase('commit'):
+            result = database.commit()
+        if not result:
+            return None
+        elapsed = time.time() - start
+        logger.info('Loaded %d rows in %.3f sec. - %.1f rows/sec, mode = %s' % (rows, elapsed, rows / elapsed if elapsed > 0 else 0, mode))
+        # Create rollup tables coarser than the sampling interval, or extend them from the last bucket
+        if append:
+            rollups = database.getRollups()
+        else:
+            sampling = (parseDate(last) - parseDate(first)).total_seconds() / max(rows - 1, 1)
+            rollups = list(filter(lambda x: x > sampling, ROLLUPS)) if backend == 'sqlite' else []
+        with metrics.phase('rollup'):
             for main in database.getColumnMainGroups():
                 for sub in database.getColumnSubGroups(main):
-                    database.insertData(database.getDatabaseTableName(main, sub), database.getColumnCounters(main, sub), self.__extractData(data, database.getColumnCounters(main, sub, key='index')))
-        result = database.commit()
+                    for interval in rollups:
+                        if not database.createRollupTable(database.getDatabaseTableName(main, sub), database.getColumnCounters(main, sub), interval, since=since):
+                            return None
+        database.updateRollups(rollups)
+        with metrics.phase('commit'):
+            result = database.endLoad()
         if not result:
-            return False
-        #
+            return None
+        # Fill in statistics by one scan of the loaded data, vectorized by blocks of columns with numpy,
+        # instead of running statistics per value while inserting, which cost more than the scan that
+        # percentiles need anyway, and only appended rows are merged into the stored moments
         for main in database.getColumnMainGroups():
             for sub in database.getColumnSubGroups(main):
+                if append:
+                    if not self.__appendStatistics(database, main, sub, since):
+                        return None
+                    continue
                 counters = database.getColumnCounters(main, sub)
-                avgs = database.averageOfData(database.getDatabaseTableName(main, sub), counters)
-                vars = database.varianceOfData(database.getDatabaseTableName(main, sub), counters)
-                if len(avgs) != len(counters) or len(vars) != len(counters):
-                    logger.error(avgs)
-                    logger.error(vars)
-                    exit(-1)
+                indexes = database.getColumnCounters(main, sub, key='index')
+                with metrics.phase('stats'):
+                    summaries = database.summaryOfData(database.getDatabaseTableName(main, sub), counters, indexes=indexes, percents=PERCENTILES)
+                if len(summaries) != len(counters):
+                    return None
                 for index, counter in enumerate(counters):
-                    database.updateColumn(main, sub, counter, 'average', avgs[index])
-                    database.updateColumn(main, sub, counter, 'variance', vars[index])
+                    for (key, value) in summaries[index].items():
+                        database.updateColumn(main, sub, counter, key, value)
+        database.updateLast(last)
         #
         result = database.update()
         if not result:
-            return False
+            return None
         #
         return database
 
+    ### the moments of the counters merged with those of the rows after since, and only percentiles and changes
+    ### recomputed from all the rows, of the counters with new samples, the others are left as they are
+    def __appendStatistics(self, database, main, sub, since):
+        counters = database.getColumnCounters(main, sub)
+        indexes = database.getColumnCounters(main, sub, key='index')
+        table = database.getDatabaseTableName(main, sub)
+        columns = database.getColumns()[main][sub]
+        with metrics.phase('stats'):
+            added = database.summaryOfData(table, counters, indexes=indexes, since=since)
+        if len(added) != len(counters):
+            return False
+        touched = list(filter(lambda x: added[x]['count'] > 0, range(len(counters))))
+        if len(touched) == 0:
+            return True
+        # catalogs of older converters may have no moments, which are then computed from all the rows
+        moments = any(map(lambda x: any(map(lambda y: columns[counters[x]].get(y) is None, ['average', 'variance', 'min', 'max'])), touched))
+        with metrics.phase('stats'):
+            summaries = database.summaryOfData(table, list(map(lambda x: counters[x], touched)), indexes=list(map(lambda x: indexes[x], touched)), percents=PERCENTILES, moments=moments)
+        if len(summaries) != len(touched):
+            return False
+        for (summary, index) in zip(summaries, touched):
+            if not moments:
+                previous = dict(columns[counters[index]])
+                # databases of older converters have no count, which is the rest of the whole
+                if previous.get('count') is None:
+                    previous['count'] = summary['count'] - added[index]['count']
+                summary.update(mergeStatistics(previous, added[index]))
+            for (key, value) in summary.items():
+                database.updateColumn(main, sub, counters[index], key, value)
+        return True
+
+
+### worker of the parallel conversion, returns the path of the shard database and its metrics
+def createDatabaseShard(csvFile, dirPath, name, date, columns, mode):
+    metrics.reset()
+    converter = DbConverter(csvFile, preserve=True)
+    return (converter.createShard(dirPath, name, date, columns, mode=mode), metrics.report())
+
+
+################################################################################
+### Class - Column Store
+################################################################################
+### <name>.col/date.i64 holds epoch seconds and <name>.col/<index>.f64 holds the counter
+### of the csv column <index>, both as native contiguous arrays read through mmap
+class ColumnStore:
+    __resource  = None
+    __dates     = None
+    __buffers   = None
+    __maps      = None
+
+    def __init__(self, dirPath):
+        self.__resource = dirPath
+        self.__buffers = {}
+        self.__maps = {}
+        pass
+
+    def __del__(self):
+        for (fp, mm) in self.__maps.values():
+            try:
+                mm.close()
+                fp.close()
+            except Exception as e:
+                logger.error(e)
+        pass
+
+    ### appended to the existing files unless they are created from scratch
+    def create(self, indexes, append=False):
+        try:
+            if not append and os.path.exists(self.__resource):
+                shutil.rmtree(self.__resource)
+            if not os.path.exists(self.__resource):
+                os.makedirs(self.__resource)
+        except Exception as e:
+            logger.error(e)
+            return False
+        self.__dates = array('q')
+        self.__buffers = { index: array('d') for index in indexes }
+        return True
+
+    def append(self, data):
+        try:
+            self.__dates.append(calendar.timegm(time.strptime(data[0], '%Y-%m-%dT%H:%M:%SZ')))
+        except Exception as e:
+            logger.error(e)
+            return False
+        for (index, buffer) in self.__buffers.items():
+            try:
+                buffer.append(float(data[index]))
+            except (TypeError, ValueError):
+                buffer.append(float('nan'))
+        if len(self.__dates) >= COMMIT_SIZE:
+            return self.flush()
+        return True
+
+    def flush(self):
+        if self.__dates is None:
+            return True
+        try:
+            with open(os.path.join(self.__resource, 'date.i64'), 'ab') as fp:
+                self.__dates.tofile(fp)
+            del self.__dates[:]
+            for (index, buffer) in self.__buffers.items():
+                with open(os.path.join(self.__resource, '%d.f64' % index), 'ab') as fp:
+                    buffer.tofile(fp)
+                del buffer[:]
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+    def __map(self, name, typecode):
+        if name not in self.__maps:
+            fp = open(os.path.join(self.__resource, name), 'rb')
+            if os.fstat(fp.fileno()).st_size == 0:
+                fp.close()
+                return memoryview(b'').cast(typecode)
+            self.__maps[name] = (fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+        return memoryview(self.__maps[name][1]).cast(typecode)
+
+    ### the number of rows, or of the rows up to last, without formatting the dates
+    def countDates(self, last=None):
+        try:
+            dates = self.__map('date.i64', 'q')
+            return bisectRight(dates, toEpoch(last)) if last else len(dates)
+        except Exception as e:
+            logger.error(e)
+            return None
+
+    ### (dates, lo, hi), the dates in the range and their position
+    def selectDates(self, first=None, last=None):
+        try:
+            dates = self.__map('date.i64', 'q')
+        except Exception as e:
+            logger.error(e)
+            return (None, 0, 0)
+        lo = bisectLeft(dates, calendar.timegm(parseDate(first).timetuple())) if first else 0
+        hi = bisectRight(dates, calendar.timegm(parseDate(last).timetuple())) if last else len(dates)
+        return (list(map(lambda x: dt.utcfromtimestamp(x).strftime('%Y-%m-%dT%H:%M:%SZ'), dates[lo:hi])), lo, hi)
+
+    ### zero-copy slice of the counter
+    def selectValues(self, index, lo, hi):
+        try:
+            return self.__map('%d.f64' % index, 'd')[lo:hi]
+        except Exception as e:
+            logger.error(e)
+            return None
+
+
+################################################################################
+### Class - Csv Reader
+################################################################################
+### rows of a PDH csv, every field of a data row is quoted and holds neither quote nor comma
+### so it is split at '","' and only the title or an odd row goes through the csv module
+class CsvReader:
+    __stream    = None
+    __width     = None
+    __rows      = None
+    __ended     = False
+
+    def __init__(self, csvFile):
+        self.__stream = openCsv(csvFile)
+        self.__rows = []
+        pass
+
+    def close(self):
+        if self.__stream is not None:
+            self.__stream.close()
+            self.__stream = None
+        return
+
+    ### bytes read of the file, or of the decompressed stream
+    def tell(self):
+        try:
+            return self.__stream.buffer.raw.tell()
+        except Exception as e:
+            logger.error(e)
+            return 0
+
+    ### a trailing comma of the title does not make a column
+    def readTitle(self):
+        line = self.__stream.readline()
+        if not line:
+            return None
+        fields = next(csv.reader([ line ]), [])
+        while len(fields) > 1 and fields[-1] == '':
+            fields.pop()
+        self.__width = len(fields)
+        return fields
+
+    ### [date, value, ...] in the width of the title, NaN for empty samples and None for other text
+    def readRow(self):
+        if len(self.__rows) == 0:
+            self.__rows = self.readRows()
+            if len(self.__rows) == 0:
+                return None
+            self.__rows.reverse()
+        return self.__rows.pop()
+
+    ### rows of the next block of about READ_BUFFER bytes, up to the first blank line
+    def readRows(self):
+        if self.__ended:
+            return []
+        lines = self.__stream.readlines(READ_BUFFER)
+        if len(lines) == 0:
+            self.__ended = True
+            return []
+        lines = list(map(lambda x: x.rstrip('\r\n'), lines))
+        if '' in lines:
+            del lines[lines.index(''):]
+            self.__ended = True
+        #
+        rows = self.__parseBlock(lines)
+        if rows is None:
+            rows = list(map(self.__parseLine, lines))
+        return rows
+
+    ### all the values of a block converted at once by the C parser of numpy,
+    ### None for a block of text values, odd widths or unquoted dates, which are parsed line by line
+    def __parseBlock(self, lines):
+        width = self.__width
+        if numpy is None or width is None or width < 2 or len(lines) == 0:
+            return None
+        #
+        try:
+            dates = list(map(lambda x: x[1:x.index('"', 1)] if x[0] == '"' else None, lines))
+            if None in dates:
+                return None
+            block = '\n'.join(lines)
+            if '" "' in block or '""' in block:
+                lines = block.replace('" "', '"nan"').replace('""', '"nan"').split('\n')
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                values = numpy.loadtxt(lines, delimiter=',', quotechar='"', usecols=range(1, width),
+                                       dtype=numpy.float64, comments=None, ndmin=2)
+        except Exception:
+            return None
+        if values.shape != (len(lines), width - 1):
+            return None
+        rows = values.tolist()
+        for (date, row) in zip(dates, rows):
+            row.insert(0, date)
+        return rows
+
+    def __parseLine(self, line):
+        if '" "' in line or '""' in line:
+            line = line.replace('" "', '"nan"').replace('""', '"nan"')
+        width = self.__width
+        fields = line[1:-1].split('","') if line[0] == '"' and line[-1] == '"' else None
+        if fields is None or (width is not None and len(fields) != width):
+            fields = next(csv.reader([ line ]), [])
+            if width is None:
+                width = len(fields)
+            del fields[width:]
+        try:
+            values = list(map(float, fields[1:]))
+        except ValueError:
+            values = list(map(toNumber, fields[1:]))
+        values.insert(0, fields[0])
+        if len(values) < width:
+            values.extend([ None ] * (width - len(values)))
+        return values
+
+
+################################################################################
+### Class - Metrics
+################################################################################
+### seconds and calls of each phase, counts of rows, bytes and so on, and peak rss of an invocation,
+### reset by the caller before it, e.g. main.py for each command or request
+class Metrics:
+    __start     = None
+    __phases    = None
+    __counts    = None
+    __children  = None
+
+    def __init__(self):
+        self.reset()
+        pass
+
+    def reset(self):
+        self.__start = time.time()
+        self.__phases = OrderedDict()
+        self.__counts = OrderedDict()
+        self.__children = OrderedDict()
+        return
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - start)
+
+    def addTime(self, name, seconds, calls=1):
+        phase = self.__phases.setdefault(name, [ 0.0, 0 ])
+        phase[0] += seconds
+        phase[1] += calls
+        return
+
+    def count(self, name, value=1):
+        self.__counts[name] = self.__counts.get(name, 0) + value
+        return
+
+    ### a report of another process, e.g. a shard of the parallel conversion
+    def attach(self, name, report):
+        self.__children.setdefault(name, []).append(report)
+        return
+
+    def report(self):
+        result = {
+            'elapsed'   : round(time.time() - self.__start, 6),
+            'phases'    : OrderedDict(map(lambda x: (x[0], {'seconds': round(x[1][0], 6), 'calls': x[1][1]}), self.__phases.items())),
+            'counts'    : dict(self.__counts),
+            'peak_rss'  : peakMemory()
+        }
+        result.update(self.__children)
+        return result
+
+
+metrics = Metrics()
+
+
+################################################################################
+### Process Tools
+################################################################################
+### peak resident set size in KiB of this process, or None without the resource module, e.g. on windows
+def peakMemory():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+################################################################################
+### File Tools
+################################################################################
+def detectCompression(path):
+    try:
+        with open(path, 'rb') as fp:
+            head = fp.read(4)
+    except Exception as e:
+        logger.error(e)
+        return None
+    for (magic, compression) in COMPRESSIONS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+### (mtime of .db, mtime of .inf), which changes with every conversion or append
+def stampOfDatabase(dbFile):
+    try:
+        return (os.path.getmtime(dbFile), os.path.getmtime(dbFile.replace('.db', '.inf')))
+    except Exception as e:
+        logger.error(e)
+        return None
+
+
+### a buffered text stream of a plain, gzip, bz2 or zip (the first csv member) file
+def openCsv(path):
+    compression = detectCompression(path)
+    if compression == 'gzip':
+        raw = gzip.open(path, 'rb')
+    elif compression == 'bz2':
+        raw = bz2.open(path, 'rb')
+    elif compression == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            members = list(filter(lambda x: not x.endswith('/'), archive.namelist()))
+            csvs = list(filter(lambda x: x.lower().endswith('.csv'), members))
+            raw = archive.open((csvs or members)[0])
+    else:
+        raw = io.FileIO(path, 'r')
+    return io.TextIOWrapper(io.BufferedReader(raw, buffer_size=READ_BUFFER), encoding='utf-8', errors='replace')
+
+
+################################################################################
+### Statistics Tools
+################################################################################
+def toFloat(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+### Chan's parallel algorithm, merges {'count', 'average', 'variance', 'min', 'max'} of two sets
+def mergeStatistics(stats1, stats2):
+    if not stats1['count']:
+        return dict(stats2)
+    if not stats2['count']:
+        return dict(stats1)
+    #
+    count = stats1['count'] + stats2['count']
+    delta = stats2['average'] - stats1['average']
+    m2 = stats1['variance'] * stats1['count'] + stats2['variance'] * stats2['count'] + delta * delta * stats1['count'] * stats2['count'] / count
+    return {
+        'count'     : count,
+        'average'   : stats1['average'] + delta * stats2['count'] / count,
+        'variance'  : m2 / count,
+        'min'       : min(stats1['min'], stats2['min']),
+        'max'       : max(stats1['max'], stats2['max'])
+    }
+
+
+### PDH writes " " or "" for missing samples
+def toNumber(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+### a 2-D numpy array (rows x columns, NaN for missing) or lists of numeric values per column
+def summarizeColumns(block, percents=[], moments=True):
+    if numpy is not None and isinstance(block, numpy.ndarray):
+        counts = numpy.count_nonzero(~numpy.isnan(block), axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            stats = {}
+            if moments:
+                stats['average'] = numpy.nanmean(block, axis=0)
+                stats['variance'] = numpy.nanvar(block, axis=0)
+                stats['min'] = numpy.nanmin(block, axis=0)
+                stats['max'] = numpy.nanmax(block, axis=0)
+            for percent in percents:
+                stats['p%d' % percent] = numpy.nanpercentile(block, percent, axis=0)
+            changes = changesOfColumns(block)
+        result = []
+        for index in range(block.shape[1]):
+            summary = { 'count': int(counts[index]) }
+            for (key, values) in stats.items():
+                summary[key] = float(values[index]) if counts[index] > 0 else 0
+            summary['changes'] = int(changes[index])
+            result.append(summary)
+        return result
+    #
+    result = []
+    for values in block:
+        summary = { 'count': len(values) }
+        if len(values) == 0:
+            for key in (['average', 'variance', 'min', 'max'] if moments else []) + ['changes'] + list(map(lambda x: 'p%d' % x, percents)):
+                summary[key] = 0
+            result.append(summary)
+            continue
+        ordered = sorted(values)
+        if moments:
+            average = sum(values) / len(values)
+            summary['average'] = average
+            summary['variance'] = sum(map(lambda x: (x - average) * (x - average), values)) / len(values)
+            summary['min'] = ordered[0]
+            summary['max'] = ordered[-1]
+        for percent in percents:
+            summary['p%d' % percent] = percentileOfSorted(ordered, percent)
+        summary['changes'] = changesOfValues(values)
+        result.append(summary)
+    return result
+
+
+### level shifts, as the number of consecutive windows of CHANGE_WINDOW samples whose averages differ
+### by more than twice the standard deviation within the windows, of each column of a 2-D numpy array
+def changesOfColumns(block):
+    windows = block.shape[0] // CHANGE_WINDOW
+    if windows < 2:
+        return numpy.zeros(block.shape[1], dtype=numpy.int64)
+    segments = block[:windows * CHANGE_WINDOW].reshape(windows, CHANGE_WINDOW, block.shape[1])
+    averages = numpy.nanmean(segments, axis=1)
+    spreads = numpy.sqrt(numpy.nanmean(numpy.nanvar(segments, axis=1), axis=0))
+    return numpy.count_nonzero(numpy.abs(numpy.diff(averages, axis=0)) > spreads * 2, axis=0)
+
+
+def changesOfValues(values):
+    windows = len(values) // CHANGE_WINDOW
+    if windows < 2:
+        return 0
+    averages = []
+    variances = []
+    for offset in range(0, windows * CHANGE_WINDOW, CHANGE_WINDOW):
+        segment = values[offset:offset + CHANGE_WINDOW]
+        average = sum(segment) / CHANGE_WINDOW
+        averages.append(average)
+        variances.append(sum(map(lambda x: (x - average) * (x - average), segment)) / CHANGE_WINDOW)
+    spread = (sum(variances) / windows) ** 0.5
+    return len(list(filter(lambda x: abs(x[1] - x[0]) > spread * 2, zip(averages, averages[1:]))))
+
+
+### variance, cv (coefficient of variation), peak (peak-to-mean ratio) or changes (level shifts)
+### of the statistics of a column, of which cv and peak are comparable between different scales
+def scoreOfColumn(column, score):
+    average = abs(column.get('average') or 0)
+    if score == 'cv':
+        value = (column.get('variance') or 0) ** 0.5 / average if average > 0 else 0
+    elif score == 'peak':
+        value = (column.get('max') or 0) / average if average > 0 else 0
+    else:
+        value = column.get(score) or 0
+    return float(value) if value == value else 0.0
+
+
+### linear interpolation between the closest ranks, as numpy.percentile does
+def percentileOfSorted(ordered, percent):
+    rank = (len(ordered) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
 
 ################################################################################
 ### Array Tools
@@ -754,25 +2484,210 @@ def sliceByIndex(valueList, indexList):
 
 
 ################################################################################
-### Dict Tools
+### Series Tools
 ################################################################################
-def margeDictList(dictList1, dictList2):
-    if dictList1 is None:
-        return dictList2
-    if dictList2 is None:
-        return dictList1
-    if len(dictList1) != len(dictList2):
-        return []
+### min/max buckets: each bucket becomes two rows at its first and last date, holding
+### the extremes of every series in their order of appearance so that spikes remain
+def downsampleData(data, maxPoints):
+    if maxPoints < 2 or len(data) <= maxPoints:
+        return data
     #
+    keys = list(filter(lambda x: x != 'date', data[0].keys()))
+    buckets = maxPoints // 2
+    size = len(data) / buckets
+    result = []
+    for bucket in range(buckets):
+        rows = data[int(bucket * size):int((bucket + 1) * size)]
+        if len(rows) == 0:
+            continue
+        head = {'date': rows[0].get('date')}
+        tail = {'date': rows[-1].get('date')}
+        for key in keys:
+            minIndex = maxIndex = None
+            for index, row in enumerate(rows):
+                value = row.get(key)
+                if not isinstance(value, (int, float)):
+                    continue
+                if minIndex is None or value < rows[minIndex][key]:
+                    minIndex = index
+                if maxIndex is None or value > rows[maxIndex][key]:
+                    maxIndex = index
+            if minIndex is None:
+                head[key] = tail[key] = None
+            elif minIndex <= maxIndex:
+                head[key] = rows[minIndex][key]
+                tail[key] = rows[maxIndex][key]
+            else:
+                head[key] = rows[maxIndex][key]
+                tail[key] = rows[minIndex][key]
+        result.append(head)
+        if len(rows) > 1:
+            result.append(tail)
+    return result
+
+
+### {'date': [date, ...], 'values': {key: [value, ...]}}, each key and date only once
+def columnarizeData(data):
+    keys = list(filter(lambda x: x != 'date', data[0].keys())) if len(data) > 0 else []
+    return {
+        'date'      : list(map(itemgetter('date'), data)),
+        'values'    : { key: list(map(lambda x: x.get(key), data)) for key in keys }
+    }
+
+
+### little endian bytes of columnarizeData: uint32 size of the json header {"size": <ROWS>, "keys": [<KEY>, ...]},
+### the header, int64 epoch seconds of the dates, then float64 values of each key in order, NaN for None
+def encodeColumns(columns):
+    keys = list(columns['values'].keys())
+    header = json.dumps({ 'size': len(columns['date']), 'keys': keys }, separators=(',', ':')).encode('utf-8')
+    dates = array('q', map(lambda x: calendar.timegm(time.strptime(x, '%Y-%m-%dT%H:%M:%SZ')), columns['date']))
+    arrays = [ dates ] + list(map(lambda x: array('d', map(lambda y: float('nan') if y is None else y, columns['values'][x])), keys))
+    if sys.byteorder == 'big':
+        for values in arrays:
+            values.byteswap()
+    return struct.pack('<I', len(header)) + header + b''.join(map(lambda x: x.tobytes(), arrays))
+
+
+### averages of the rows in buckets of interval seconds, dated by the start of the bucket
+def resampleData(data, interval):
+    buckets = OrderedDict()
+    for row in data:
+        date = parseDate(row['date'])
+        if date is None:
+            continue
+        bucket = buckets.setdefault(formatDate(floorDate(date, interval)), {})
+        for (key, value) in row.items():
+            if key == 'date' or not isinstance(value, (int, float)) or value != value:
+                continue
+            (total, count) = bucket.get(key, (0, 0))
+            bucket[key] = (total + value, count + 1)
+    keys = [ key for key in (data[0].keys() if len(data) > 0 else []) if key != 'date' ]
     result = []
-    for index in range(len(dictList1)):
-        res = {}
-        res.update(dictList1[index])
-        res.update(dictList2[index])
-        result.append(res)
+    for (date, bucket) in buckets.items():
+        row = { 'date': date }
+        for key in keys:
+            (total, count) = bucket.get(key, (0, 0))
+            row[key] = total / count if count > 0 else None
+        result.append(row)
     return result
 
 
+################################################################################
+### Date Tools
+################################################################################
+__re_iso = re.compile(r"^([0-9]{4})-([0-9]{2})-([0-9]{2})[T ]([0-9]{2}):([0-9]{2}):([0-9]{2})")
+
+### YYYY-MM-DDThh:mm:ss[.ffffff][Z] -> YYYY-MM-DDThh:mm:ssZ as stored in the database,
+### None for no date and ValueError for others, which are not to be taken as no bound
+def normalizeDate(date):
+    if not date:
+        return None
+    match = __re_iso.match(str(date))
+    if not match:
+        raise ValueError('Invalid date format. - %s' % date)
+    return '%s-%s-%sT%s:%s:%sZ' % match.groups()
+
+
+def parseDate(date):
+    date = normalizeDate(date)
+    if date is None:
+        return None
+    return dt.strptime(date, '%Y-%m-%dT%H:%M:%SZ')
+
+
+def formatDate(date):
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def toEpoch(date):
+    return calendar.timegm(parseDate(date).timetuple())
+
+
+def floorDate(date, interval):
+    seconds = (date - dt(1970, 1, 1)).total_seconds()
+    return dt.utcfromtimestamp(seconds - seconds % interval)
+
+
+def bisectLeft(values, value):
+    (lo, hi) = (0, len(values))
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def bisectRight(values, value):
+    (lo, hi) = (0, len(values))
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if value < values[mid]:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+################################################################################
+### Dict Tools
+################################################################################
+### sorted merge of lists ordered by the date into one row per date, the values of a list
+### without the date are None or, with fill = 'forward', those of its previous row,
+### keys are those of each list, so that a list without rows still has its None values
+def mergeDictList(dictLists, fill='null', keys=None):
+    return list(mergeDictIter(map(iter, dictLists), fill=fill, keys=keys))
+
+
+### mergeDictList over iterators, which are read only as far as the rows yielded
+def mergeDictIter(iterators, fill='null', keys=None):
+    heads = []
+    sources = []
+    blanks = []
+    for (index, iterator) in enumerate(iterators):
+        head = next(iterator, None)
+        blank = dict.fromkeys(keys[index]) if keys is not None else {}
+        if head is not None:
+            blank.update(dict.fromkeys(key for key in head.keys() if key != 'date'))
+        heads.append(head)
+        sources.append(iterator)
+        blanks.append(blank)
+    previous = list(blanks) if fill == 'forward' else blanks
+    series = range(len(sources))
+    while True:
+        dates = [ head['date'] for head in heads if head is not None ]
+        if len(dates) == 0:
+            return
+        date = min(dates)
+        row = { 'date': date }
+        for i in series:
+            head = heads[i]
+            if head is not None and head['date'] == date:
+                data = head
+                heads[i] = next(sources[i], None)
+                if fill == 'forward':
+                    previous[i] = data
+            else:
+                data = previous[i]
+            row.update(data)
+        row['date'] = date
+        yield row
+
+
+### {main: {sub: {counter: index}}}, databases of the same layout take rows of each other
+def layoutOfColumns(columns):
+    return {
+        main: {
+            sub: { counter: column['index'] for (counter, column) in counters.items() } for (sub, counters) in subs.items()
+        } for (main, subs) in (columns or {}).items()
+    }
+
+
+def prefixDictList(dictList, prefix):
+    return list(map(lambda x: { (key if key == 'date' else prefix + key): value for (key, value) in x.items() }, dictList))
+
+
 def cleanupNestedDict(nestedDict, level=1):
     delKeys = []
     for key in nestedDict:
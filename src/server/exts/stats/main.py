@@ -13,10 +13,13 @@ __version__ = '0.2.0'
 ################################################################################
 ### Required Modules
 ################################################################################
+from collections import deque
 import argparse
+import atexit
 import json
 import logging
 import os
+import select
 import sys
 
 
@@ -80,6 +83,11 @@ def GetArgs():
         required=False,
         help='get basename of stats from csv ("-f" option will be needed)'
     )
+    group_common.add_argument('-i', '--probe',
+        action='store_true',
+        required=False,
+        help='get name, dates and columns of stats from csv without converting ("-f" option will be needed)'
+    )
     group_common.add_argument('-v', '--convert',
         action='store_true',
         required=False,
@@ -90,6 +98,16 @@ def GetArgs():
         required=False,
         help='get information from db ("-db" option will be needed)'
     )
+    group_common.add_argument('-pr', '--profile',
+        action='store_true',
+        required=False,
+        help='write cProfile statistics of the invocation, or of each request of the server, to the log directory (optional)'
+    )
+    group_common.add_argument('-s', '--server',
+        action='store_true',
+        required=False,
+        help='serve "get" requests as json lines on stdin/stdout until EOF'
+    )
     #
     group_convert = parser.add_argument_group(
         title='convert',
@@ -106,6 +124,30 @@ def GetArgs():
         default=False,
         help='preserve the original csv file (optional)',
     )
+    group_convert.add_argument('-m', '--mode',
+        action='store',
+        choices=['safe', 'fast'],
+        default='safe',
+        help='set load mode, "fast" skips journaling and syncing while loading (optional)',
+    )
+    group_convert.add_argument('-b', '--backend',
+        action='store',
+        choices=['sqlite', 'column'],
+        default='sqlite',
+        help='set storage backend, "column" stores each counter as a float64 array (optional)',
+    )
+    group_convert.add_argument('-j', '--jobs',
+        action='store',
+        type=int,
+        default=1,
+        help='set number of worker processes sharing the column groups (optional)',
+        metavar='<NUMBER>'
+    )
+    group_convert.add_argument('-a', '--append',
+        action='store_true',
+        required=False,
+        help='append rows to the existing db of the same name and columns (optional)'
+    )
     #
     group_get = parser.add_argument_group(
         title='get information',
@@ -113,8 +155,9 @@ def GetArgs():
     )
     group_get.add_argument('-db', '--database',
         action='store',
+        nargs='+',
         required=False,
-        help='set database path (.db)',
+        help='set database path (.db), several paths get data of them aligned on the date ("-sd" option only)',
         metavar='<FILEPATH>'
     )
     group_get.add_argument('-ac', '--all_counters',
@@ -132,6 +175,46 @@ def GetArgs():
         required=False,
         help='get vitality counters',
     )
+    group_get.add_argument('-vt', '--vitality_top',
+        action='store',
+        type=int,
+        default=statslib.VITALITY_TOP,
+        help='set number of vitality counters ("-vc" option only, optional)',
+        metavar='<NUMBER>'
+    )
+    group_get.add_argument('-vs', '--vitality_score',
+        action='store',
+        choices=statslib.SCORES,
+        default='variance',
+        help='set score of vitality counters, "cv" is coefficient of variation, "peak" is peak-to-mean ratio, "changes" is number of level shifts ("-vc" option only, optional)',
+    )
+    group_get.add_argument('-vg', '--vitality_group_top',
+        action='store',
+        type=int,
+        required=False,
+        help='set maximum number of vitality counters of each counter group ("-vc" option only, optional)',
+        metavar='<NUMBER>'
+    )
+    group_get.add_argument('-sc', '--search_counters',
+        action='store',
+        required=False,
+        help='search counters whose group, instance or name contains every word of query',
+        metavar='<QUERY>'
+    )
+    group_get.add_argument('-of', '--offset',
+        action='store',
+        type=int,
+        default=0,
+        help='set number of matched counters to skip ("-sc" option only, optional)',
+        metavar='<NUMBER>'
+    )
+    group_get.add_argument('-lm', '--limit',
+        action='store',
+        type=int,
+        default=statslib.SEARCH_LIMIT,
+        help='set maximum number of matched counters ("-sc" option only, optional)',
+        metavar='<NUMBER>'
+    )
     group_get.add_argument('-sd', '--specific_data',
         action='store_true',
         required=False,
@@ -155,6 +238,42 @@ def GetArgs():
         help='set last date for data filtering',
         metavar='<UTC Format>'
     )
+    group_get.add_argument('-mp', '--max_points',
+        action='store',
+        type=int,
+        required=False,
+        help='set maximum number of data points, reduced by min/max buckets (optional)',
+        metavar='<NUMBER>'
+    )
+    group_get.add_argument('-ri', '--interval',
+        action='store',
+        type=int,
+        required=False,
+        help='set interval in seconds which data is resampled to by averages (optional)',
+        metavar='<SECONDS>'
+    )
+    group_get.add_argument('-o', '--output',
+        action='store',
+        choices=['rows', 'columns', 'binary'],
+        default='rows',
+        help='set format of data, "columns" is compact json of a date array and a value array per counter, "binary" is its float64 encoding (optional)',
+    )
+    group_get.add_argument('-st', '--stream',
+        action='store_true',
+        required=False,
+        help='print data by chunks as read, a row per line for "rows", a block per line for "columns" or a frame per block for "binary" (optional)'
+    )
+    group_get.add_argument('-nk', '--no_cache',
+        action='store_true',
+        required=False,
+        help='get data without reading or writing cached results next to the db (optional)'
+    )
+    group_get.add_argument('-fl', '--fill',
+        action='store',
+        choices=['null', 'forward'],
+        default='null',
+        help='set how values missing at a date of another counter are filled (optional)',
+    )
     #
     args = parser.parse_args()
     return (args, parser)
@@ -172,6 +291,190 @@ def printResult(data):
     return
 
 
+def printBinary(data):
+    try:
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    except Exception as e:
+        logger.error(e)
+        sys.exit(RET_SYS_ERROR)
+    return
+
+
+### metrics of statslib since the last reset, which are logged as well
+def reportMetrics():
+    report = statslib.metrics.report()
+    logger.info('Metrics. - %s' % json.dumps(report, separators=(',', ':')))
+    return report
+
+
+def printLine(data):
+    try:
+        sys.stdout.write(json.dumps(data, separators=(',', ':')) + '\n')
+        sys.stdout.flush()
+    except Exception as e:
+        logger.error(e)
+        sys.exit(RET_SYS_ERROR)
+    return
+
+
+### {"id": <ID>, "database": <FILEPATH> | [<FILEPATH>, ...], "type": <TYPE>, "counters": <COUNTERS>, "first_date": <UTC>, "last_date": <UTC>, "max_points": <NUMBER>, "interval": <SECONDS>, "fill": <FILL>, "output": "rows" | "columns", "stream": <BOOL>}
+### {"id": <ID>, "database": <FILEPATH>, "type": "vitality-counters", "top": <NUMBER>, "score": <SCORE>, "group_top": <NUMBER>}
+### {"id": <ID>, "database": <FILEPATH>, "type": "search-counters", "query": <QUERY>, "offset": <NUMBER>, "limit": <NUMBER>}
+### {"id": <ID>, "type": "cancel"} stops the stream of the request id
+### with "stream", chunks of data are passed to emit as {"chunk": <DATA>} before the response until cancelled
+def handleRequest(request, pool, emit=None, cache=None, cancelled=None):
+    databases = request.get('database')
+    databases = databases if isinstance(databases, list) else [ databases ]
+    for database in databases:
+        if not database or not os.path.exists(database):
+            logger.error('No database found. - %s' % database)
+            return {'status': RET_NO_FILE, 'msg': 'No database found.'}
+    database = databases[0]
+    #
+    type = request.get('type')
+    if type == 'all-counters' or type == 'nonzero-counters' or type == 'vitality-counters':
+        logger.info('Get %s from db. - %s' % (type, database))
+        option = 'vitality' if type == 'vitality-counters' else 'nonzero'
+        if type == 'vitality-counters' and request.get('score') and request['score'] not in statslib.SCORES:
+            logger.error('Bad score of vitality. - %s' % request['score'])
+            return {'status': RET_BAD_PARAM, 'msg': 'Bad request.'}
+        counters = statslib.getStatsCounters(database, option=option, pool=pool, top=request.get('top') or statslib.VITALITY_TOP, score=request.get('score') or 'variance', groupTop=request.get('group_top'))
+        if counters is None:
+            logger.error('Failed in getting %s from db. - %s' % (type, database))
+            return {'status': RET_BAD_FILE, 'msg': 'Failed.'}
+        return {'status': RET_NORMAL_END, 'msg': 'Succeeded.', 'counters': counters, 'metrics': reportMetrics()}
+    if type == 'search-counters':
+        logger.info('Search counters in db. - query = %s' % request.get('query'))
+        result = statslib.searchStatsCounters(database, request.get('query'), offset=request.get('offset') or 0, limit=request.get('limit') or statslib.SEARCH_LIMIT, pool=pool)
+        if result is None:
+            logger.error('Failed in searching counters in db. - query = %s' % request.get('query'))
+            return {'status': RET_BAD_FILE, 'msg': 'Failed.'}
+        return dict(result, status=RET_NORMAL_END, msg='Succeeded.', metrics=reportMetrics())
+    if type == 'data':
+        try:
+            statslib.normalizeDate(request.get('first_date'))
+            statslib.normalizeDate(request.get('last_date'))
+        except ValueError as e:
+            logger.error(e)
+            return {'status': RET_BAD_PARAM, 'msg': 'Invalid date format.'}
+    if type == 'data' and request.get('counters') and request.get('stream') and emit is not None:
+        logger.info('Stream specific data from db. - counters = %s' % request['counters'])
+        rows = 0
+        for chunk in statslib.iterStatsData(databases if len(databases) > 1 else database, request['counters'], first=request.get('first_date'), last=request.get('last_date'), maxPoints=request.get('max_points'), pool=pool, interval=request.get('interval'), fill=request.get('fill', 'null')):
+            with statslib.metrics.phase('serialize'):
+                emit({'chunk': statslib.columnarizeData(chunk) if request.get('output') == 'columns' else chunk})
+            rows += len(chunk)
+            if cancelled is not None and cancelled():
+                logger.info('Stream cancelled. - rows = %d' % rows)
+                return {'status': RET_NORMAL_END, 'msg': 'Cancelled.', 'rows': rows, 'metrics': reportMetrics()}
+        return {'status': RET_NORMAL_END, 'msg': 'Succeeded.', 'rows': rows, 'metrics': reportMetrics()}
+    if type == 'data' and request.get('counters'):
+        logger.info('Get specific data from db. - counters = %s' % request['counters'])
+        data = statslib.getStatsData(databases if len(databases) > 1 else database, request['counters'], first=request.get('first_date'), last=request.get('last_date'), maxPoints=request.get('max_points'), pool=pool, interval=request.get('interval'), fill=request.get('fill', 'null'), cache=cache)
+        if data is None:
+            logger.error('Failed in getting specific data from db. - counters = %s' % request['counters'])
+            return {'status': RET_BAD_FILE, 'msg': 'Failed.'}
+        if request.get('output') == 'columns':
+            with statslib.metrics.phase('serialize'):
+                data = statslib.columnarizeData(data)
+        return {'status': RET_NORMAL_END, 'msg': 'Succeeded.', 'data': data, 'metrics': reportMetrics()}
+    # Bad request
+    logger.error('Bad request. - %s' % type)
+    return {'status': RET_BAD_PARAM, 'msg': 'Bad request.'}
+
+
+### with profile, cProfile statistics of each request are written to dirpath
+def serve(profile=False, dirpath='.'):
+    pool = statslib.DatabasePool()
+    cache = statslib.ResultCache()
+    reader = RequestReader(sys.stdin)
+    while True:
+        line = reader.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        #
+        request = None
+        try:
+            request = json.loads(line)
+        except Exception as e:
+            logger.error(e)
+        # a cancel of a request which has been served already
+        if isinstance(request, dict) and request.get('type') == 'cancel':
+            continue
+        statslib.metrics.reset()
+        profiler = debuglib.SetupProfiler() if profile else None
+        try:
+            emit = lambda x, id=request.get('id'): printLine(dict(x, status=RET_NORMAL_END, id=id))
+            cancelled = lambda id=request.get('id'): reader.cancelled(id)
+            response = handleRequest(request, pool, emit=emit, cache=cache, cancelled=cancelled)
+            response['id'] = request.get('id')
+        except Exception as e:
+            logger.error(e)
+            # the id is kept whenever the line is parsed, or the request is never settled by the client
+            response = {'status': RET_SYS_ERROR, 'msg': 'Failed.', 'id': request.get('id') if isinstance(request, dict) else None}
+        if profiler is not None:
+            logger.info('Profile saved. - %s' % debuglib.SaveProfile(profiler, filename='stats-request%s' % response['id'], dirpath=dirpath))
+        printLine(response)
+    return
+
+
+################################################################################
+### Class - Request Reader
+################################################################################
+### lines of stdin read from its descriptor, so that the lines sent while a request is served,
+### e.g. a cancel of the stream, are seen by polling without blocking
+class RequestReader:
+    __fd        = None
+    __buffer    = b''
+    __lines     = None
+    __eof       = False
+
+    def __init__(self, stream):
+        self.__fd = stream.fileno()
+        self.__lines = deque()
+        pass
+
+    def __read(self):
+        data = os.read(self.__fd, 64 * 1024)
+        if not data:
+            self.__eof = True
+            if self.__buffer:
+                self.__lines.append(self.__buffer)
+                self.__buffer = b''
+            return
+        lines = (self.__buffer + data).split(b'\n')
+        self.__buffer = lines.pop()
+        self.__lines.extend(lines)
+        return
+
+    ### the next line, or '' at the end of stdin
+    def readline(self):
+        while len(self.__lines) == 0 and not self.__eof:
+            self.__read()
+        if len(self.__lines) == 0:
+            return ''
+        return self.__lines.popleft().decode('utf-8') + '\n'
+
+    ### whether a cancel of the request id has been sent, which is taken out of the lines
+    def cancelled(self, id):
+        # select does not support pipes on windows, where requests are never cancelled
+        if os.name == 'posix':
+            while not self.__eof and len(select.select([self.__fd], [], [], 0)[0]) > 0:
+                self.__read()
+        for line in list(self.__lines):
+            try:
+                request = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(request, dict) and request.get('type') == 'cancel' and request.get('id') == id:
+                self.__lines.remove(line)
+                return True
+        return False
+
+
 ################################################################################
 ### Main Function
 ################################################################################
@@ -183,6 +486,18 @@ if __name__ == '__main__':
         sys.exit(RET_NO_DIRECTORY)
     debuglib.SetupLogger(filename="stats.log", dirpath=args.log)
     #
+    if args.server:
+        logger.info('Start serving requests.')
+        serve(profile=args.profile, dirpath=args.log)
+        logger.info('Stop serving requests.')
+        sys.exit(RET_NORMAL_END)
+    #
+    statslib.metrics.reset()
+    if args.profile:
+        # saved at sys.exit of any command
+        profiler = debuglib.SetupProfiler()
+        atexit.register(lambda: logger.info('Profile saved. - %s' % debuglib.SaveProfile(profiler, filename='stats', dirpath=args.log)))
+    #
     if args.basename:
         if args.csvfile:
             if not os.path.exists(args.csvfile):
@@ -202,6 +517,26 @@ if __name__ == '__main__':
         parser.print_help()
         sys.exit(RET_BAD_PARAM)
     #
+    if args.probe:
+        if args.csvfile:
+            if not os.path.exists(args.csvfile):
+                logger.error('No csv file found. - %s' % args.csvfile)
+                sys.exit(RET_NO_FILE)
+            #
+            logger.info('Probe stats from csv. - %s' % args.csvfile)
+            probe = statslib.probeStats(args.csvfile)
+            if probe is None:
+                logger.error('Failed in probing stats from csv. - %s' % args.csvfile)
+                sys.exit(RET_BAD_FILE)
+            #
+            probe['msg'] = 'Succeeded.'
+            printResult(probe)
+            logger.info('Succeeded.')
+            sys.exit(RET_NORMAL_END)
+        # Bad options
+        parser.print_help()
+        sys.exit(RET_BAD_PARAM)
+    #
     if args.convert:
         if args.csvfile:
             if not os.path.exists(args.csvfile):
@@ -209,12 +544,12 @@ if __name__ == '__main__':
                 sys.exit(RET_NO_FILE)
             #
             logger.info('Convert csv to database. - %s' % args.csvfile)
-            basename = statslib.convertCsv2Database(args.csvfile, preserve=args.preserve)
+            basename = statslib.convertCsv2Database(args.csvfile, preserve=args.preserve, mode=args.mode, backend=args.backend, jobs=args.jobs, append=args.append)
             if basename is None:
                 logger.error('Failed in convering csv to db. - %s' % args.csvfile)
                 sys.exit(RET_BAD_FILE)
             #
-            printResult({'msg': 'Succeeded.', 'basename': basename})
+            printResult({'msg': 'Succeeded.', 'basename': basename, 'metrics': reportMetrics()})
             logger.info('Succeeded.')
             sys.exit(RET_NORMAL_END)
         # Bad options
@@ -223,9 +558,12 @@ if __name__ == '__main__':
     #
     if args.get:
         if args.database:
-            if not os.path.exists(args.database):
-                logger.error('No database found. - %s' % args.database)
-                sys.exit(RET_NO_FILE)
+            for database in args.database:
+                if not os.path.exists(database):
+                    logger.error('No database found. - %s' % database)
+                    sys.exit(RET_NO_FILE)
+            databases = args.database
+            args.database = databases[0]
             #
             if args.all_counters:
                 logger.info('Get all counters from db. - %s' % args.database)
@@ -233,7 +571,7 @@ if __name__ == '__main__':
                 if counters is None:
                     logger.error('Failed in getting all counters from db. - %s' % args.database)
                     sys.exit(RET_BAD_FILE)
-                printResult({'msg': 'Succeeded.', 'counters': counters})
+                printResult({'msg': 'Succeeded.', 'counters': counters, 'metrics': reportMetrics()})
                 logger.info('Succeeded.')
                 sys.exit(RET_NORMAL_END)
             if args.nonzero_counters:
@@ -242,26 +580,67 @@ if __name__ == '__main__':
                 if counters is None:
                     logger.error('Failed in getting non-zero counters from db. - %s' % args.database)
                     sys.exit(RET_BAD_FILE)
-                printResult({'msg': 'Succeeded.', 'counters': counters})
+                printResult({'msg': 'Succeeded.', 'counters': counters, 'metrics': reportMetrics()})
                 logger.info('Succeeded.')
                 sys.exit(RET_NORMAL_END)
             if args.vitality_counters:
                 logger.info('Get vitality counters from db. - %s' % args.database)
-                counters = statslib.getStatsCounters(args.database, option='vitality')
+                counters = statslib.getStatsCounters(args.database, option='vitality', top=args.vitality_top, score=args.vitality_score, groupTop=args.vitality_group_top)
                 if counters is None:
                     logger.error('Failed in getting vitality counters from db. - %s' % args.database)
                     sys.exit(RET_BAD_FILE)
-                printResult({'msg': 'Succeeded.', 'counters': counters})
+                printResult({'msg': 'Succeeded.', 'counters': counters, 'metrics': reportMetrics()})
+                logger.info('Succeeded.')
+                sys.exit(RET_NORMAL_END)
+            if args.search_counters is not None:
+                logger.info('Search counters in db. - query = %s' % args.search_counters)
+                result = statslib.searchStatsCounters(args.database, args.search_counters, offset=args.offset, limit=args.limit)
+                if result is None:
+                    logger.error('Failed in searching counters in db. - query = %s' % args.search_counters)
+                    sys.exit(RET_BAD_FILE)
+                printResult(dict(result, msg='Succeeded.', metrics=reportMetrics()))
                 logger.info('Succeeded.')
                 sys.exit(RET_NORMAL_END)
             if args.specific_data:
+                try:
+                    statslib.normalizeDate(args.first_date)
+                    statslib.normalizeDate(args.last_date)
+                except ValueError as e:
+                    logger.error(e)
+                    sys.exit(RET_BAD_PARAM)
                 if args.counters:
+                    if args.stream:
+                        logger.info('Stream specific data from db. - counters = %s' % args.counters)
+                        rows = 0
+                        for chunk in statslib.iterStatsData(databases if len(databases) > 1 else args.database, args.counters, first=args.first_date, last=args.last_date, maxPoints=args.max_points, interval=args.interval, fill=args.fill):
+                            with statslib.metrics.phase('serialize'):
+                                if args.output == 'binary':
+                                    printBinary(statslib.encodeColumns(statslib.columnarizeData(chunk)))
+                                elif args.output == 'columns':
+                                    printLine({'data': statslib.columnarizeData(chunk)})
+                                else:
+                                    for row in chunk:
+                                        printLine(row)
+                            rows += len(chunk)
+                        reportMetrics()
+                        logger.info('Succeeded. - %d rows' % rows)
+                        sys.exit(RET_NORMAL_END)
                     logger.info('Get specific data from db. - counters = %s' % args.counters)
-                    data = statslib.getStatsData(args.database, args.counters, first=args.first_date, last=args.last_date)
+                    data = statslib.getStatsData(databases if len(databases) > 1 else args.database, args.counters, first=args.first_date, last=args.last_date, maxPoints=args.max_points, interval=args.interval, fill=args.fill, cache=None if args.no_cache else statslib.ResultCache(size=0))
                     if data is None:
                         logger.error('Failed in getting specific data from db. - counters = %s' % args.counters)
                         sys.exit(RET_BAD_FILE)
-                    printResult({'msg': 'Succeeded.', 'data': data})
+                    if args.output == 'binary':
+                        with statslib.metrics.phase('serialize'):
+                            data = statslib.encodeColumns(statslib.columnarizeData(data))
+                        reportMetrics()
+                        printBinary(data)
+                    elif args.output == 'columns':
+                        with statslib.metrics.phase('serialize'):
+                            data = statslib.columnarizeData(data)
+                        printLine({'msg': 'Succeeded.', 'data': data, 'metrics': reportMetrics()})
+                    else:
+                        printResult({'msg': 'Succeeded.', 'data': data, 'metrics': reportMetrics()})
                     logger.info('Succeeded.')
                     sys.exit(RET_NORMAL_END)
                 # Bad options
@@ -374,59 +374,96 @@ function convertStats(file: string): Promise<string> {
   })
 }
 
-function getStatsCountersSync(file: string, option?: string): any {
-  try {
-    let counters: any
-    switch (option) {
-      case "nonzero":
-        counters = StatsTool.getNonZeroCountersSync(file)
-        break
-
-      case "vitality":
-        counters = StatsTool.getVitalityCountersSync(file)
-        break
-
-      case "all":
-      default:
-        counters = StatsTool.getAllCountersSync(file)
-        break
-    }
-    return counters
-  } catch (err) {
-    (err instanceof Error) && logger.error(`${ err.name }: ${ err.message }`)
-    return null
-  }
-}
-
-function getStatsCounters(file: string, option?: string): Promise<any> {
+function getStatsCounters(file: string, option?: string, top?: number, score?: string, groupTop?: number): Promise<any> {
   return new Promise<any>((resolve: (counters: any) => void, reject: (err? :any) => void) => {
-    return setImmediate(() => {
-      let err = new Error(`Resource: ${ file } cloudn't be converted.`)
-      err.name = "Internal"
-      const counters = getStatsCountersSync(file, option)
+    let err = new Error(`Resource: ${ file } cloudn't be converted.`)
+    err.name = "Internal"
+    const request = (option === "nonzero")  ? StatsTool.getNonZeroCounters(file)
+                  : (option === "vitality") ? StatsTool.getVitalityCounters(file, top, score, groupTop)
+                  : StatsTool.getAllCounters(file)
+    return request
+    .then((counters: any) => {
       return counters ? resolve(counters) : reject(err)
     })
+    .catch((e: any) => {
+      (e instanceof Error) && logger.error(`${ e.name }: ${ e.message }`)
+      return reject(((e instanceof Error) && (e.name === "External")) ? e : err)
+    })
   })
 }
 
-function getStatsSpecificDataSync(file: string, counter: string): any {
-  try {
-    const data = StatsTool.getSpecificDataSync(file, counter)
-    return data
-  } catch (err) {
-    (err instanceof Error) && logger.error(`${ err.name }: ${ err.message }`)
-    return null
-  }
+function searchStatsCounters(file: string, query: string, offset?: number, limit?: number): Promise<any> {
+  return new Promise<any>((resolve: (result: any) => void, reject: (err? :any) => void) => {
+    let err = new Error(`Resource: ${ file } cloudn't be converted.`)
+    err.name = "Internal"
+    return StatsTool.searchCounters(file, query, offset, limit)
+    .then((result: any) => {
+      return result ? resolve(result) : reject(err)
+    })
+    .catch((e: any) => {
+      (e instanceof Error) && logger.error(`${ e.name }: ${ e.message }`)
+      return reject(((e instanceof Error) && (e.name === "External")) ? e : err)
+    })
+  })
 }
 
-function getStatsSpecificData(file: string, counter: string): Promise<any> {
+function getStatsSpecificData(file: string, counter: string, first?: string, last?: string, maxPoints?: number): Promise<any> {
   return new Promise<any>((resolve: (data: any) => void, reject: (err? :any) => void) => {
-    return setImmediate(() => {
-      let err = new Error(`Resource: ${ file } cloudn't be converted.`)
-      err.name = "Internal"
-      const data = getStatsSpecificDataSync(file, counter)
+    let err = new Error(`Resource: ${ file } cloudn't be converted.`)
+    err.name = "Internal"
+    return StatsTool.getSpecificData(file, counter, first, last, maxPoints)
+    .then((data: any) => {
       return data ? resolve(data) : reject(err)
     })
+    .catch((e: any) => {
+      (e instanceof Error) && logger.error(`${ e.name }: ${ e.message }`)
+      return reject(((e instanceof Error) && (e.name === "External")) ? e : err)
+    })
+  })
+}
+
+function getStatsSpecificColumns(file: string, counter: string, first?: string, last?: string, maxPoints?: number): Promise<any> {
+  return new Promise<any>((resolve: (data: any) => void, reject: (err? :any) => void) => {
+    let err = new Error(`Resource: ${ file } cloudn't be converted.`)
+    err.name = "Internal"
+    return StatsTool.getSpecificColumns(file, counter, first, last, maxPoints)
+    .then((data: any) => {
+      return data ? resolve(data) : reject(err)
+    })
+    .catch((e: any) => {
+      (e instanceof Error) && logger.error(`${ e.name }: ${ e.message }`)
+      return reject(((e instanceof Error) && (e.name === "External")) ? e : err)
+    })
+  })
+}
+
+function getStatsFederatedData(files: string[], counter: string, first?: string, last?: string, interval?: number, maxPoints?: number): Promise<any> {
+  return new Promise<any>((resolve: (data: any) => void, reject: (err? :any) => void) => {
+    let err = new Error(`Resource: ${ files.join(", ") } cloudn't be converted.`)
+    err.name = "Internal"
+    return StatsTool.getFederatedData(files, counter, first, last, interval, maxPoints)
+    .then((data: any) => {
+      return data ? resolve(data) : reject(err)
+    })
+    .catch((e: any) => {
+      (e instanceof Error) && logger.error(`${ e.name }: ${ e.message }`)
+      return reject(((e instanceof Error) && (e.name === "External")) ? e : err)
+    })
+  })
+}
+
+function streamStatsSpecificData(file: string, counter: string, onChunk: (rows: any[]) => void | Promise<void>, first?: string, last?: string): Promise<number> {
+  return new Promise<number>((resolve: (rows: number) => void, reject: (err? :any) => void) => {
+    let err = new Error(`Resource: ${ file } cloudn't be converted.`)
+    err.name = "Internal"
+    return StatsTool.streamSpecificData(file, counter, onChunk, first, last)
+    .then((rows: number) => {
+      return (rows !== null) ? resolve(rows) : reject(err)
+    })
+    .catch((e: any) => {
+      (e instanceof Error) && logger.error(`${ e.name }: ${ e.message }`)
+      return reject(((e instanceof Error) && (e.name === "External")) ? e : err)
+    })
   })
 }
 
@@ -1193,8 +1230,14 @@ export function validateStatsResource(user: string, domain: string, project: str
   })
 }
 
+// names of stats are <name>_<date>_<version of the conversion>, and a capture is the same one
+// whatever version it was converted by, e.g. "_1" of migrated stats and "_2" of a new upload
+function stripStatsVersionSync(statsName: string): string {
+  return statsName.replace(/(_[0-9]{14})_[0-9]+$/, "$1")
+}
+
 function existsStatsNameSync(user: string, domain: string, project: string, statsName: string): boolean {
-  return !!getStatsResourceListSync(user, domain, project).find((statsInfo: StatsInfo) => (statsInfo.name === statsName))
+  return !!getStatsResourceListSync(user, domain, project).find((statsInfo: StatsInfo) => (stripStatsVersionSync(statsInfo.name) === stripStatsVersionSync(statsName)))
 }
 
 export function existsStatsName(user: string, domain: string, project: string, statsName: string): Promise<void> {
@@ -1296,6 +1339,14 @@ export function deleteStatsResource(user: string, domain: string, project: strin
       .then(() => {
         return deleteResource(getStatsResourcePathSync(user, domain, project, statsId) + ".inf")
       })
+      .then(() => {
+        const columnPath = getStatsResourcePathSync(user, domain, project, statsId) + ".col"
+        return existsResourcePathSync(columnPath) ? deleteResource(columnPath) : Promise.resolve()
+      })
+      .then(() => {
+        const cachePath = getStatsResourcePathSync(user, domain, project, statsId) + ".cache"
+        return existsResourcePathSync(cachePath) ? deleteResource(cachePath) : Promise.resolve()
+      })
       .then(() => {
         return Atomic.lock(getProjectInfoPathSync(user, domain, project))
       })
@@ -1322,10 +1373,10 @@ export function deleteStatsResource(user: string, domain: string, project: strin
   })
 }
 
-export function getStatsCounterList(user: string, domain: string, project: string, statsId: string, option?: string): Promise<any> {
+export function getStatsCounterList(user: string, domain: string, project: string, statsId: string, option?: string, top?: number, score?: string, groupTop?: number): Promise<any> {
   return new Promise<any>((resolve: (counters: any) => void, reject: (err?: any) => void) => {
     return setImmediate(() => {
-      return getStatsCounters(getStatsResourcePathSync(user, domain, project, statsId) + ".db", option)
+      return getStatsCounters(getStatsResourcePathSync(user, domain, project, statsId) + ".db", option, top, score, groupTop)
       .then((counters: any) => {
         return resolve(counters)
       })
@@ -1336,10 +1387,39 @@ export function getStatsCounterList(user: string, domain: string, project: strin
   })
 }
 
-export function getStatsCounterData(user: string, domain: string, project: string, statsId: string, counter: string): Promise<any> {
+export function searchStatsCounterList(user: string, domain: string, project: string, statsId: string, query: string, offset?: number, limit?: number): Promise<any> {
+  return new Promise<any>((resolve: (result: any) => void, reject: (err?: any) => void) => {
+    return setImmediate(() => {
+      return searchStatsCounters(getStatsResourcePathSync(user, domain, project, statsId) + ".db", query, offset, limit)
+      .then((result: any) => {
+        return resolve(result)
+      })
+      .catch((err: any) => {
+        return reject(err)
+      })
+    })
+  })
+}
+
+export function getStatsCounterData(user: string, domain: string, project: string, statsId: string, counter: string, first?: string, last?: string, maxPoints?: number): Promise<any> {
   return new Promise<any>((resolve: (counters: any) => void, reject: (err?: any) => void) => {
     return setImmediate(() => {
-      return getStatsSpecificData(getStatsResourcePathSync(user, domain, project, statsId) + ".db", counter)
+      return getStatsSpecificData(getStatsResourcePathSync(user, domain, project, statsId) + ".db", counter, first, last, maxPoints)
+      .then((data: any) => {
+        return resolve(data)
+      })
+      .catch((err: any) => {
+        return reject(err)
+      })
+    })
+  })
+}
+
+// { date: [date, ...], values: { key: [value, ...] } }
+export function getStatsCounterColumns(user: string, domain: string, project: string, statsId: string, counter: string, first?: string, last?: string, maxPoints?: number): Promise<any> {
+  return new Promise<any>((resolve: (data: any) => void, reject: (err?: any) => void) => {
+    return setImmediate(() => {
+      return getStatsSpecificColumns(getStatsResourcePathSync(user, domain, project, statsId) + ".db", counter, first, last, maxPoints)
       .then((data: any) => {
         return resolve(data)
       })
@@ -1350,4 +1430,39 @@ export function getStatsCounterData(user: string, domain: string, project: strin
   })
 }
 
+// the same counters of several stats, e.g. of several hosts, on the dates of all of them
+export function getStatsFederatedCounterData(user: string, domain: string, project: string, statsIds: Array<string>, counter: string, first?: string, last?: string, interval?: number, maxPoints?: number): Promise<any> {
+  return new Promise<any>((resolve: (data: any) => void, reject: (err?: any) => void) => {
+    return setImmediate(() => {
+      const invalid = statsIds.find((statsId: string) => !validateStatsResourceSync(user, domain, project, statsId))
+      if (invalid !== undefined) {
+        let err = new Error(`stats: stats ID = ${ invalid } is invalid stats resource.`)
+        err.name = "External"
+        return reject(err)
+      }
+      return getStatsFederatedData(statsIds.map((statsId: string) => getStatsResourcePathSync(user, domain, project, statsId) + ".db"), counter, first, last, interval, maxPoints)
+      .then((data: any) => {
+        return resolve(data)
+      })
+      .catch((err: any) => {
+        return reject(err)
+      })
+    })
+  })
+}
+
+export function streamStatsCounterData(user: string, domain: string, project: string, statsId: string, counter: string, onChunk: (rows: any[]) => void | Promise<void>, first?: string, last?: string): Promise<number> {
+  return new Promise<number>((resolve: (rows: number) => void, reject: (err?: any) => void) => {
+    return setImmediate(() => {
+      return streamStatsSpecificData(getStatsResourcePathSync(user, domain, project, statsId) + ".db", counter, onChunk, first, last)
+      .then((rows: number) => {
+        return resolve(rows)
+      })
+      .catch((err: any) => {
+        return reject(err)
+      })
+    })
+  })
+}
+
 //---
@@ -5,6 +5,27 @@ import * as path from "path"
 import logger = require("./logger")
 
 const rootPath: string = process.cwd()
+const statsPath: string = path.join("src", "server", "exts", "stats")
+const statsTimeout: number = 5 * 60 * 1000  // msec without any response line of a request
+const statsBadParam: number = -2            // RET_BAD_PARAM of main.py, e.g. on a date of an unknown format
+
+type StatsRequest = {
+  resolve : (result: any) => void,
+  reject  : (err?: any) => void,
+  onChunk?: (chunk: any) => void | Promise<void>,
+  timer   : NodeJS.Timeout,
+  cancelled?: boolean
+}
+
+let statsDaemon: child_process.ChildProcess = null
+let statsDaemonBuffer: string = ""
+let statsDaemonWaiting: number = 0  // id of the request whose chunk is being consumed
+let statsRequestId: number = 0
+const statsRequests: Map<number, StatsRequest> = new Map<number, StatsRequest>()
+
+function getLogPath(): string {
+  return process.env.STORAGE_PATH ? path.join(process.env.STORAGE_PATH, "log") : path.join(rootPath, process.env.npm_package_config_log_path!)
+}
 
 function execStatsSync(file: string, mode: string, type?: string, target?: string): any {
   const options: Array<string> = []
@@ -39,9 +60,9 @@ function execStatsSync(file: string, mode: string, type?: string, target?: strin
   const result = child_process.spawnSync("python", [
     "main.py",
     "-l",
-    process.env.STORAGE_PATH ? path.join(process.env.STORAGE_PATH, "log") : path.join(rootPath, process.env.npm_package_config_log_path!),
+    getLogPath(),
   ].concat(options), {
-    cwd: path.join("src", "server", "exts", "stats"),
+    cwd: statsPath,
     encoding: "utf-8"
   })
 
@@ -58,6 +79,155 @@ function execStatsSync(file: string, mode: string, type?: string, target?: strin
   }
 }
 
+// a request is rejected when the daemon stops answering it, e.g. on a reply without its id
+function watchStats(id: number): NodeJS.Timeout {
+  return setTimeout(() => {
+    const request = statsRequests.get(id)
+    if (request !== undefined) {
+      statsRequests.delete(id)
+      logger.error(`stats daemon: id=${ id } timed out`)
+      request.reject(new Error(`Stats request timed out, id=${ id }`))
+      cancelStats(id)
+      resumeStats(id)
+    }
+  }, statsTimeout)
+}
+
+// a stream of the daemon stops at its next chunk, the rest of which is dropped
+function cancelStats(id: number): void {
+  const request = statsRequests.get(id)
+  if (request !== undefined) {
+    request.cancelled = true
+  }
+  statsDaemon && statsDaemon.stdin.write(JSON.stringify({ id: id, type: "cancel" }) + "\n")
+}
+
+// the output of the daemon is paused until a chunk is consumed, e.g. written out to a slow client,
+// so that the daemon blocks on its pipe instead of the chunks piling up in memory,
+// and the stream is cancelled when the chunk is rejected, e.g. as the client has gone
+function waitStats(id: number, pending: Promise<void>): void {
+  statsDaemonWaiting = id
+  statsDaemon.stdout.pause()
+  pending.then(() => {
+    resumeStats(id)
+  }, () => {
+    cancelStats(id)
+    resumeStats(id)
+  })
+}
+
+function resumeStats(id: number): void {
+  if (statsDaemonWaiting !== id || statsDaemon === null) {
+    return
+  }
+  statsDaemonWaiting = 0
+  statsDaemon.stdout.resume()
+  onStatsDaemonData("")
+}
+
+function onStatsDaemonData(chunk: string): void {
+  statsDaemonBuffer += chunk
+  let index: number
+  while (!statsDaemonWaiting && (index = statsDaemonBuffer.indexOf("\n")) >= 0) {
+    const line = statsDaemonBuffer.slice(0, index)
+    statsDaemonBuffer = statsDaemonBuffer.slice(index + 1)
+
+    let response: any
+    try {
+      response = JSON.parse(line)
+    } catch (err) {
+      (err instanceof Error) && logger.error(`${ err.name }: ${ err.message }`)
+      continue
+    }
+
+    const request = statsRequests.get(response.id)
+    if (request === undefined) {
+      logger.error(`stats daemon: unknown response id=${ response.id }, status=${ response.status }`)
+      continue
+    }
+    clearTimeout(request.timer)
+    if (response.chunk !== undefined) {
+      request.timer = watchStats(response.id)
+      const pending = !request.cancelled && request.onChunk && request.onChunk(response.chunk)
+      if (pending instanceof Promise) {
+        waitStats(response.id, pending)
+      }
+      continue
+    }
+    statsRequests.delete(response.id)
+
+    if (response.status === statsBadParam) {
+      // a fault of the request rather than of the stats, rejected to be answered as a bad request
+      logger.error(`stats daemon: id=${ response.id }, status=${ response.status }, msg=${ response.msg }`)
+      const err = new Error(`Bad request of stats: ${ response.msg }`)
+      err.name = "External"
+      request.reject(err)
+    } else if (response.status !== 0) {
+      logger.error(`stats daemon: id=${ response.id }, status=${ response.status }, msg=${ response.msg }`)
+      request.resolve(null)
+    } else {
+      request.resolve(response)
+    }
+  }
+}
+
+function onStatsDaemonExit(reason: string): void {
+  logger.error(`stats daemon: pid=${ statsDaemon && statsDaemon.pid } stopped, ${ reason }`)
+  statsDaemon = null
+  statsDaemonBuffer = ""
+  statsDaemonWaiting = 0
+  statsRequests.forEach((request: StatsRequest) => {
+    clearTimeout(request.timer)
+    request.reject(new Error(`Stats daemon stopped, ${ reason }`))
+  })
+  statsRequests.clear()
+}
+
+function getStatsDaemon(): child_process.ChildProcess {
+  if (statsDaemon !== null) {
+    return statsDaemon
+  }
+
+  statsDaemon = child_process.spawn("python", [
+    "main.py",
+    "-l",
+    getLogPath(),
+    "-s"
+  ], {
+    cwd: statsPath,
+    stdio: ["pipe", "pipe", "ignore"]
+  })
+  statsDaemon.stdout.setEncoding("utf-8")
+  statsDaemon.stdout.on("data", onStatsDaemonData)
+  statsDaemon.on("exit", (code: number, signal: string) => onStatsDaemonExit(`status=${ code | 0 }, signal=${ signal }`))
+  statsDaemon.on("error", (err: Error) => onStatsDaemonExit(`error=${ err.message }`))
+  statsDaemon.stdin.on("error", (err: Error) => logger.error(`stats daemon: ${ err.name }: ${ err.message }`))
+  logger.info(`stats daemon: pid=${ statsDaemon.pid } started`)
+  return statsDaemon
+}
+
+function sendStats(request: any, onChunk?: (chunk: any) => void | Promise<void>): Promise<any> {
+  return new Promise<any>((resolve: (result: any) => void, reject: (err?: any) => void) => {
+    const id = ++statsRequestId
+    statsRequests.set(id, { resolve: resolve, reject: reject, onChunk: onChunk, timer: watchStats(id) })
+    getStatsDaemon().stdin.write(JSON.stringify(Object.assign({ id: id }, request)) + "\n")
+  })
+}
+
+function execStats(file: string | string[], type: string, target?: string, first?: string, last?: string, maxPoints?: number, interval?: number, output?: string, onChunk?: (chunk: any) => void | Promise<void>): Promise<any> {
+  return sendStats({
+    database  : file,
+    type      : type,
+    counters  : target,
+    first_date: first,
+    last_date : last,
+    max_points: maxPoints,
+    interval  : interval,
+    output    : output,
+    stream    : (onChunk !== undefined)
+  }, onChunk)
+}
+
 export function extractStatsNameSync(file: string): string {
   const result = execStatsSync(file, "name")
   return (result !== null) ? result.basename : null
@@ -71,22 +241,57 @@ export function convertStatsSync(file: string): string {
   return (result !== null) ? result.basename : null
 }
 
-export function getAllCountersSync(file: string): any {
-  const result = execStatsSync(file, "get", "all-counters")
-  return (result !== null) ? result.counters : null
+export function getAllCounters(file: string): Promise<any> {
+  return execStats(file, "all-counters")
+  .then((result: any) => (result !== null) ? result.counters : null)
+}
+
+export function getNonZeroCounters(file: string): Promise<any> {
+  return execStats(file, "nonzero-counters")
+  .then((result: any) => (result !== null) ? result.counters : null)
+}
+
+export function getVitalityCounters(file: string, top?: number, score?: string, groupTop?: number): Promise<any> {
+  return sendStats({
+    database  : file,
+    type      : "vitality-counters",
+    top       : top,
+    score     : score,
+    group_top : groupTop
+  })
+  .then((result: any) => (result !== null) ? result.counters : null)
+}
+
+export function searchCounters(file: string, query: string, offset?: number, limit?: number): Promise<any> {
+  return sendStats({
+    database  : file,
+    type      : "search-counters",
+    query     : query,
+    offset    : offset,
+    limit     : limit
+  })
+  .then((result: any) => (result !== null) ? { total: result.total, counters: result.counters } : null)
+}
+
+export function getSpecificData(file: string, counters: string, first?: string, last?: string, maxPoints?: number): Promise<any> {
+  return execStats(file, "data", counters, first, last, maxPoints)
+  .then((result: any) => (result !== null) ? result.data : null)
 }
 
-export function getNonZeroCountersSync(file: string): any {
-  const result = execStatsSync(file, "get", "nonzero-counters")
-  return (result !== null) ? result.counters : null
+// { date: [date, ...], values: { key: [value, ...] } }
+export function getSpecificColumns(file: string, counters: string, first?: string, last?: string, maxPoints?: number): Promise<any> {
+  return execStats(file, "data", counters, first, last, maxPoints, undefined, "columns")
+  .then((result: any) => (result !== null) ? result.data : null)
 }
 
-export function getVitalityCountersSync(file: string): any {
-  const result = execStatsSync(file, "get", "vitality-counters")
-  return (result !== null) ? result.counters : null
+// rows are passed to onChunk by chunks as read, and the next chunk waits for the promise onChunk returns if any,
+// which cancels the stream when rejected, resolves the number of rows
+export function streamSpecificData(file: string, counters: string, onChunk: (rows: any[]) => void | Promise<void>, first?: string, last?: string): Promise<number> {
+  return execStats(file, "data", counters, first, last, undefined, undefined, undefined, onChunk)
+  .then((result: any) => (result !== null) ? result.rows : null)
 }
 
-export function getSpecificDataSync(file: string, counters: string): any {
-  const result = execStatsSync(file, "get", "data", counters)
-  return (result !== null) ? result.data : null
+export function getFederatedData(files: string[], counters: string, first?: string, last?: string, interval?: number, maxPoints?: number): Promise<any> {
+  return execStats(files, "data", counters, first, last, maxPoints, interval)
+  .then((result: any) => (result !== null) ? result.data : null)
 }
@@ -83,7 +83,77 @@ router.param("counter", (req: Request, res: Response, next: NextFunction, counte
 
 router.route("/:domain/projects/:projectName/stats/:statsId/counters/:counter")
 .get((req: Request, res: Response, next: NextFunction) => {
-  return Project.getStatsCounterData(req.token.usr, req.domain, req.project, req.statsId, req.counter)
+  const date_from = (typeof(req.query.date_from) === "string") ? decodeURIComponent(req.query.date_from) : null
+  const date_to   = (typeof(req.query.date_to)   === "string") ? decodeURIComponent(req.query.date_to)   : null
+  const maxPoints = (typeof(req.query.max_points) === "string") ? (Number(req.query.max_points) || null)  : null
+  const others    = (typeof(req.query.with) === "string") ? decodeURIComponent(req.query.with).split(",").filter((statsId: string) => statsId !== "") : []
+  if (others.length > 0) {
+    // the same counters of other stats of the project, e.g. of other hosts, side by side
+    const statsIds  = [req.statsId].concat(others)
+    const interval  = (typeof(req.query.interval) === "string") ? (Number(req.query.interval) || null) : null
+    return Project.getStatsFederatedCounterData(req.token.usr, req.domain, req.project, statsIds, req.counter, date_from, date_to, interval, maxPoints)
+    .then((data: any) => {
+      // OK
+      return res.status(200).json({
+        msg: `You get stats counter data of stats ID = ${ statsIds.join(", ") }, counters = ${ req.counter }.`,
+        data: data
+      })
+    })
+    .catch((err: any) => {
+      return ((err instanceof Error) && (err.name === "External"))
+        ? // Bad Request
+          res.status(400).json({ msg: err.message })
+        : // Internal Server Error
+          res.status(500).json({ msg: "Contact an administrator." })
+    })
+  }
+  if (req.query.stream === "ndjson") {
+    // a row per line as read, without holding the whole data
+    return Project.streamStatsCounterData(req.token.usr, req.domain, req.project, req.statsId, req.counter, (rows: any[]) => {
+      if (res.destroyed || res.writableEnded) {
+        // the client has gone, the rest of the stream is cancelled
+        return Promise.reject(new Error("Stream closed"))
+      }
+      res.headersSent || res.status(200).type("application/x-ndjson")
+      if (res.write(rows.map((row: any) => JSON.stringify(row) + "\n").join(""))) {
+        return
+      }
+      // the next chunk waits until the client drains the buffered ones, or is cancelled if it goes
+      return new Promise<void>((resolve: () => void, reject: (err?: any) => void) => {
+        const drain = () => {
+          res.removeListener("close", close)
+          resolve()
+        }
+        const close = () => {
+          res.removeListener("drain", drain)
+          reject(new Error("Stream closed"))
+        }
+        if (res.destroyed) {
+          return close()
+        }
+        res.once("drain", drain)
+        res.once("close", close)
+      })
+    }, date_from, date_to)
+    .then((rows: number) => {
+      // OK
+      return res.headersSent ? res.end() : res.status(200).type("application/x-ndjson").end()
+    })
+    .catch((err: any) => {
+      return res.headersSent
+        ? res.end()
+        : ((err instanceof Error) && (err.name === "External"))
+          ? // Bad Request
+            res.status(400).json({ msg: err.message })
+          : // Internal Server Error
+            res.status(500).json({ msg: "Contact an administrator." })
+    })
+  }
+  // a date array and a value array per counter, without repeating the keys in every row
+  const request = (req.query.format === "columns")
+                ? Project.getStatsCounterColumns(req.token.usr, req.domain, req.project, req.statsId, req.counter, date_from, date_to, maxPoints)
+                : Project.getStatsCounterData(req.token.usr, req.domain, req.project, req.statsId, req.counter, date_from, date_to, maxPoints)
+  return request
   .then((data: any) => {
     // OK
     return res.status(200).json({
@@ -108,10 +178,36 @@ router.route("/:domain/projects/:projectName/stats/:statsId/counters/:counter")
 
 router.route("/:domain/projects/:projectName/stats/:statsId/counters")
 .get((req: Request, res: Response, next: NextFunction) => {
+  if (typeof(req.query.search) === "string") {
+    // a page of matched counters instead of the whole tree
+    const offset  = (typeof(req.query.offset) === "string") ? (Number(req.query.offset) || 0)  : 0
+    const limit   = (typeof(req.query.limit)  === "string") ? (Number(req.query.limit) || null) : null
+    return Project.searchStatsCounterList(req.token.usr, req.domain, req.project, req.statsId, decodeURIComponent(req.query.search), offset, limit)
+    .then((result: any) => {
+      // OK
+      return res.status(200).json({
+        msg: `You search stats counters of stats ID = ${ req.statsId }.`,
+        total: result.total,
+        offset: offset,
+        counters: result.counters
+      })
+    })
+    .catch((err: any) => {
+      return ((err instanceof Error) && (err.name === "External"))
+        ? // Bad Request
+          res.status(400).json({ msg: err.message })
+        : // Internal Server Error
+          res.status(500).json({ msg: "Contact an administrator." })
+    })
+  }
   const option  = (req.query.option && (req.query.option === "nonzero" || req.query.option === "vitality"))
                 ? req.query.option
                 : "all"
-  return Project.getStatsCounterList(req.token.usr, req.domain, req.project, req.statsId, option)
+  // ranking of the vitality option
+  const top       = (typeof(req.query.top) === "string") ? (Number(req.query.top) || null) : null
+  const score     = ((typeof(req.query.score) === "string") && ["variance", "cv", "peak", "changes"].includes(req.query.score)) ? req.query.score : null
+  const groupTop  = (typeof(req.query.group_top) === "string") ? (Number(req.query.group_top) || null) : null
+  return Project.getStatsCounterList(req.token.usr, req.domain, req.project, req.statsId, option, top, score, groupTop)
   .then((counters: any) => {
     // OK
     return res.status(200).json({